@@ -3,11 +3,13 @@
 #
 
 import datetime
+import json
 import os
+import time
 from urllib.parse import urlencode
 
 from starlette.applications import Starlette
-from starlette.responses import PlainTextResponse, Response
+from starlette.responses import JSONResponse, Response, StreamingResponse
 from starlette.routing import Mount, Route, WebSocketRoute
 from starlette.staticfiles import StaticFiles
 from starlette.types import Receive, Scope, Send
@@ -19,6 +21,51 @@ STATIC_URL = "/"
 LOGS_PATH = os.path.join(STATIC_ROOT, "logs")
 QVIS_URL = "https://qvis.quictools.info/"
 
+# Benchmark payloads are streamed from one shared chunk, never built in full.
+CHUNK_SIZE = 64 * 1024
+CHUNK = b"Z" * CHUNK_SIZE
+MAX_PAYLOAD_SIZE = 50000000
+MAX_COUNT_LENGTH = 16
+
+
+async def generate_payload(size):
+    """
+    Yield ``size`` bytes of generated data in chunks of at most CHUNK_SIZE.
+    """
+    remaining = size
+    while remaining > 0:
+        length = min(remaining, CHUNK_SIZE)
+        yield CHUNK if length == CHUNK_SIZE else CHUNK[:length]
+        remaining -= length
+
+
+class BenchCounter:
+    """
+    Byte and message counters for a benchmark endpoint.
+    """
+
+    def __init__(self):
+        self.bytes = 0
+        self.messages = 0
+        self.started = None
+
+    def add(self, length):
+        if self.started is None:
+            self.started = time.monotonic()
+        self.bytes += length
+        self.messages += 1
+
+    def report(self):
+        elapsed = time.monotonic() - self.started if self.started else 0.0
+        return {
+            "bytes": self.bytes,
+            "messages": self.messages,
+            "elapsed": round(elapsed, 6),
+            "bytes_per_sec": round(self.bytes / elapsed, 1) if elapsed else 0.0,
+            "messages_per_sec": round(self.messages / elapsed, 1) if elapsed else 0.0,
+        }
+
+
 async def echo(request):
     """
     HTTP echo endpoint.
@@ -30,10 +77,25 @@ async def echo(request):
 
 async def padding(request):
     """
-    Dynamically generated data, maximum 50MB.
+    Dynamically generated data, maximum 50MB, streamed in chunks.
+    """
+    size = min(MAX_PAYLOAD_SIZE, request.path_params["size"])
+    return StreamingResponse(
+        generate_payload(size),
+        media_type="text/plain",
+        headers={"content-length": str(size)},
+    )
+
+
+async def upload(request):
+    """
+    HTTP upload sink, reports the received byte rate.
     """
-    size = min(50000000, request.path_params["size"])
-    return PlainTextResponse("Z" * size)
+    counter = BenchCounter()
+    async for chunk in request.stream():
+        if chunk:
+            counter.add(len(chunk))
+    return JSONResponse(counter.report())
 
 
 async def ws(websocket):
@@ -81,10 +143,99 @@ async def wt(scope: Scope, receive: Receive, send: Send) -> None:
                 )
 
 
+async def wt_bench(scope: Scope, receive: Receive, send: Send, mode: str) -> None:
+    """
+    WebTransport benchmark endpoint.
+
+    - ``datagram``: echo every datagram.
+    - ``sink``: discard stream data.
+    - ``source``: reply to a decimal byte count sent on a stream, which the
+      client then ends, with that many generated bytes, then end the stream.
+      Anything that is not a count gets an empty reply.
+    - ``echo``: echo stream data on the same stream.
+
+    A ``REPORT`` datagram is answered with the counters as JSON. They count
+    the bytes received, except in ``source`` mode, where they count the
+    bytes sent.
+    """
+    message = await receive()
+    assert message["type"] == "webtransport.connect"
+    await send({"type": "webtransport.accept"})
+
+    counter = BenchCounter()
+    requests = {}
+    while True:
+        message = await receive()
+        if message["type"] == "webtransport.datagram.receive":
+            data = message["data"]
+            if data == b"REPORT":
+                await send(
+                    {
+                        "type": "webtransport.datagram.send",
+                        "data": json.dumps(counter.report()).encode(),
+                    }
+                )
+                continue
+            counter.add(len(data))
+            if mode == "datagram":
+                await send({"type": "webtransport.datagram.send", "data": data})
+        elif message["type"] == "webtransport.stream.receive":
+            data = message["data"]
+            if data and mode != "source":
+                counter.add(len(data))
+            if mode == "echo" and data:
+                await send(
+                    {
+                        "type": "webtransport.stream.send",
+                        "data": data,
+                        "stream": message["stream"],
+                    }
+                )
+            elif mode == "source":
+                # The count may arrive in pieces, so wait for the end of the stream.
+                request = requests.setdefault(message["stream"], bytearray())
+                request += data[:MAX_COUNT_LENGTH - len(request)]
+                if not message.get("end_stream"):
+                    continue
+                del requests[message["stream"]]
+                try:
+                    size = max(0, min(MAX_PAYLOAD_SIZE, int(request)))
+                except ValueError:
+                    size = 0
+                async for chunk in generate_payload(size):
+                    counter.add(len(chunk))
+                    await send(
+                        {
+                            "type": "webtransport.stream.send",
+                            "data": chunk,
+                            "stream": message["stream"],
+                        }
+                    )
+                await send(
+                    {
+                        "type": "webtransport.stream.send",
+                        "data": b"",
+                        "stream": message["stream"],
+                        "end_stream": True,
+                    }
+                )
+        elif message["type"] == "webtransport.close":
+            return
+
+
+WT_BENCH_MODES = {
+    "/wt/datagram": "datagram",
+    "/wt/sink": "sink",
+    "/wt/source": "source",
+    "/wt/echo": "echo",
+}
+
+
 starlette = Starlette(
     routes=[
         Route("/{size:int}", padding),
         Route("/echo", echo, methods=["POST"]),
+        Route("/bench/upload", upload, methods=["POST"]),
         WebSocketRoute("/ws", ws),
     ]
 )
@@ -93,5 +244,7 @@ starlette = Starlette(
 async def app(scope: Scope, receive: Receive, send: Send) -> None:
     if scope["type"] == "webtransport" and scope["path"] == "/wt":
         await wt(scope, receive, send)
+    elif scope["type"] == "webtransport" and scope["path"] in WT_BENCH_MODES:
+        await wt_bench(scope, receive, send, WT_BENCH_MODES[scope["path"]])
     else:
         await starlette(scope, receive, send)
\ No newline at end of file
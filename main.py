@@ -1,4 +1,6 @@
+import argparse
 import asyncio
+import ipaddress
 import logging
 from typing import Dict, Optional
 from aioquic.asyncio.protocol import QuicConnectionProtocol
@@ -10,18 +12,61 @@ from aioquic.h3.events import (
     WebTransportStreamDataReceived,
 )
 from aioquic.quic.configuration import QuicConfiguration
-from aioquic.quic.events import QuicEvent
+from aioquic.quic.events import ConnectionTerminated, QuicEvent
+from quic_telephony.cdr import CdrRecorder, open_cdr_sink
+from quic_telephony.federation import FederationNode
+from quic_telephony.profiling import Profiler, ProfilerControlServer, note_command
 
 logging.basicConfig(level=logging.DEBUG)
 
 # Global registry of connected clients
 clients: Dict[str, "WebTransportHandler"] = {}
 
+# Inter-node routing for users connected to other servers, if enabled
+federation: Optional[FederationNode] = None
+
+# Call detail records, if enabled
+cdr: Optional[CdrRecorder] = None
+
+
+def deliver(user_id: str, message: str) -> bool:
+    """
+    Deliver a message to a user connected to this server.
+    """
+    handler = clients.get(user_id)
+    if handler is None:
+        return False
+    handler.send_stream(message)
+    if handler.transmit:
+        handler.transmit()
+    if cdr:
+        record_delivery(user_id, message)
+    return True
+
+
+def record_delivery(user_id: str, message: str):
+    """
+    Record answers and hang-ups as they reach their target.
+
+    All records of a call are kept on the caller's node, which recorded its
+    start. Answers always travel to the caller, so they are recorded when
+    delivered. A BYE is recorded when delivered only if this node knows the
+    call, that is when it reaches the caller; a BYE from the caller is
+    recorded on its own node once delivered.
+    """
+    command, _, payload = message.partition(" ")
+    sender = payload.split("|", 1)[0]
+    if command == "ANSWER":
+        cdr.answer(sender, user_id)
+    elif command == "BYE" and cdr.has_call(sender, user_id):
+        cdr.bye(sender, user_id)
+
 
 class WebTransportHandler:
-    def __init__(self, http, stream_id):
+    def __init__(self, http, stream_id, transmit=None):
         self._http = http
         self.stream_id = stream_id
+        self.transmit = transmit
         self.user_id: Optional[str] = None
 
     def register(self, user_id: str):
@@ -29,35 +74,89 @@ class WebTransportHandler:
         Register a user and associate it with this handler.
         """
         global clients
+        if self.user_id != user_id:
+            self.unregister()
         self.user_id = user_id
         clients[user_id] = self
+        if federation:
+            federation.register(user_id)
+        if cdr:
+            cdr.register(user_id)
         logging.info(f"User registered: {user_id}")
         logging.info(self)
         # self.send_datagram(user_id=self.stream_id,  message=f"REGISTERED {user_id}".encode())
-        self._http.send_data(stream_id=self.stream_id,  data=f"REGISTERED {user_id}".encode(), end_stream=False)
+        self.send_stream(f"REGISTERED {user_id}")
         return f"REGISTERED {user_id}"
 
+    def unregister(self):
+        """
+        Forget the user of this handler, unless another connection has
+        registered it since.
+        """
+        if self.user_id is None:
+            return
+        if clients.get(self.user_id) is self:
+            del clients[self.user_id]
+            if federation:
+                federation.unregister(self.user_id)
+        self.user_id = None
+
     def send_datagram(self, message: str, user_id):
         """
         Send a datagram back to the client.
         """
         self._http.send_datagram(data=message, stream_id=user_id)
 
+    def route(self, target_user: str, message: str, on_delivered=None) -> bool:
+        """
+        Send a message to a user on this server or, through the federation,
+        on another one.
+
+        ``on_delivered`` runs once the message has reached the target. For a
+        remote user that happens after this returns, and not at all if the
+        user is not connected anywhere; the federation then sends the ERROR.
+        Returns False if the user is known not to exist.
+        """
+        if target_user in clients:
+            if not deliver(target_user, message):
+                return False
+            if on_delivered:
+                on_delivered()
+            return True
+        if federation:
+            federation.route(self.user_id, target_user, message, on_delivered)
+            return True
+        return False
+
+    def confirm(self, message: str):
+        """
+        Send a confirmation, which may be due to a federation ack arriving
+        outside of this connection's own events.
+        """
+        self.send_stream(message)
+        if self.transmit:
+            self.transmit()
+
     def handle_call(self, payload: str):
         """
         Forward an SDP offer to the target user.
         """
         try:
             logging.info(payload)
-            global clients
             target_user, sdp_offer = payload.split("|", 1)
-            logging.info("GETTING USER")
-            logging.info(target_user)
-            target_handler = clients[target_user]
-            logging.info(target_handler)
-            return target_user, sdp_offer, target_handler
         except ValueError:
-            self.send_datagram(message=b"ERROR Invalid CALL format", user_id=self.stream_id)
+            self.send_stream("ERROR Invalid CALL format")
+            return None
+        user_id = self.user_id
+
+        def delivered():
+            if cdr:
+                cdr.call_start(user_id, target_user)
+            logging.info(f"CALL sent from {user_id} to {target_user}")
+
+        if not self.route(target_user, f"CALL {user_id}|{sdp_offer}", delivered):
+            self.send_stream(f"ERROR User {target_user} not found")
+        return target_user, sdp_offer, clients.get(target_user)
 
     def handle_answer(self, payload: str):
         """
@@ -65,27 +164,33 @@ class WebTransportHandler:
         """
         try:
             target_user, sdp_answer = payload.split("|", 1)
-            target_handler = clients.get(target_user)
-            if target_handler:
-                target_handler.send_datagram(f"ANSWER {self.user_id}|{sdp_answer}")
-                self.send_datagram(f"ANSWER_SENT {target_user}")
-                logging.info(f"ANSWER sent from {self.user_id} to {target_user}")
-            else:
-                self.send_datagram(f"ERROR User {target_user} not found")
         except ValueError:
-            self.send_datagram("ERROR Invalid ANSWER format")
+            self.send_stream("ERROR Invalid ANSWER format")
+            return
+        user_id = self.user_id
+
+        def delivered():
+            self.confirm(f"ANSWER_SENT {target_user}")
+            logging.info(f"ANSWER sent from {user_id} to {target_user}")
+
+        if not self.route(target_user, f"ANSWER {user_id}|{sdp_answer}", delivered):
+            self.send_stream(f"ERROR User {target_user} not found")
 
     def handle_bye(self, target_user: str):
         """
         Send a BYE command to the target user.
         """
-        target_handler = clients.get(target_user)
-        if target_handler:
-            target_handler.send_datagram(f"BYE {self.user_id}")
-            self.send_datagram(f"BYE_SENT {target_user}")
-            logging.info(f"BYE sent from {self.user_id} to {target_user}")
-        else:
-            self.send_datagram(f"ERROR User {target_user} not found")
+        user_id = self.user_id
+
+        def delivered():
+            self.confirm(f"BYE_SENT {target_user}")
+            # Recorded on delivery instead if the call started at the target.
+            if cdr and cdr.has_call(user_id, target_user):
+                cdr.bye(user_id, target_user)
+            logging.info(f"BYE sent from {user_id} to {target_user}")
+
+        if not self.route(target_user, f"BYE {user_id}", delivered):
+            self.send_stream(f"ERROR User {target_user} not found")
 
     def process_stream_data(self, data):
         """
@@ -105,11 +210,8 @@ class WebTransportHandler:
         """
         logging.info(f"Sending stream message: {message}")
         try:
-            self._http.send_data(
-                stream_id=self.stream_id,
-                data=message.encode(),
-                end_stream=False
-            )
+            # WebTransport stream payloads are raw bytes, not HTTP/3 DATA frames.
+            self._http._quic.send_stream_data(self.stream_id, message.encode(), end_stream=False)
             logging.info(f"Message sent on stream {self.stream_id}")
         except Exception as e:
             logging.error(f"Error sending stream message: {e}")
@@ -130,6 +232,9 @@ class WebTransportServerProtocol(QuicConnectionProtocol):
         Handle QUIC events and route them to HTTP/3.
         """
         logging.info(f"QUIC event received: {event}")
+        if isinstance(event, ConnectionTerminated):
+            for handler in self._handlers.values():
+                handler.unregister()
         if self._http is None:
             self._http = H3Connection(self._quic, enable_webtransport=True)
 
@@ -200,6 +305,7 @@ class WebTransportServerProtocol(QuicConnectionProtocol):
         Process commands received via datagram or stream.
         """
         command, _, payload = message.partition(" ")
+        note_command(command, payload)
         logging.info(f"Processing command: {command} with payload: {payload}")
 
         if command == "REGISTER":
@@ -236,8 +342,10 @@ class WebTransportServerProtocol(QuicConnectionProtocol):
             )
             logging.info(f"WebTransport session established on stream {event.stream_id}")
             # Create a bidirectional stream for the handler
-            bidirectional_stream_id = self._quic.get_next_available_stream_id(is_unidirectional=False)
-            self._handlers[event.stream_id] = WebTransportHandler(self._http, bidirectional_stream_id)
+            bidirectional_stream_id = self._http.create_webtransport_stream(event.stream_id)
+            self._handlers[event.stream_id] = WebTransportHandler(
+                self._http, bidirectional_stream_id, transmit=self.transmit
+            )
         else:
             self._http.send_headers(
                 stream_id=event.stream_id, headers=[(b":status", b"405")]
@@ -283,21 +391,85 @@ async def stream_handler(reader: asyncio.StreamReader, writer: asyncio.StreamWri
     except Exception as e:
         logging.error(e)
 
+def parse_peer(value: str):
+    """
+    Parse a federation peer given as NAME=HOST:PORT.
+    """
+    name, _, address = value.partition("=")
+    host, _, port = address.rpartition(":")
+    return name, (host.strip("[]"), int(port))
+
+
+def is_loopback(host: str) -> bool:
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return host == "localhost"
+
+
 async def main():
     """
     Start the standalone WebTransport signaling server.
     """
+    global federation, cdr
+    parser = argparse.ArgumentParser(description="WebTransport signaling server.")
+    parser.add_argument("--port", type=int, default=4433)
+    parser.add_argument("--admin-socket", help="Unix socket path for profiler control")
+    parser.add_argument("--node-name", help="name of this node in the federation")
+    parser.add_argument(
+        "--federation-host",
+        default="127.0.0.1",
+        help="address for inbound peer links; other than loopback, needs --federation-secret-file and --federation-ca",
+    )
+    parser.add_argument("--federation-port", type=int, default=4434)
+    parser.add_argument("--federation-ca", help="CA file to verify the certificates of peer nodes")
+    parser.add_argument("--federation-secret-file", help="file holding the secret shared by all federation nodes")
+    parser.add_argument(
+        "--peer", action="append", default=[], type=parse_peer, help="federation peer as NAME=HOST:PORT"
+    )
+    parser.add_argument(
+        "--cdr", help="write call detail records to an SQLite file (*.db) or a directory of JSON lines files"
+    )
+    args = parser.parse_args()
+    if (
+        args.node_name
+        and not is_loopback(args.federation_host)
+        and not (args.federation_secret_file and args.federation_ca)
+    ):
+        parser.error("a non-loopback --federation-host needs --federation-secret-file and --federation-ca")
+
     configuration = QuicConfiguration(is_client=False, alpn_protocols=["h3"])
     configuration.load_cert_chain(certfile="cert.pem", keyfile="key.pem")
 
+    if args.node_name:
+        secret = None
+        if args.federation_secret_file:
+            with open(args.federation_secret_file) as fp:
+                secret = fp.read().strip()
+        federation = FederationNode(
+            args.node_name, dict(args.peer), deliver, ca_file=args.federation_ca, secret=secret
+        )
+        await federation.start(args.federation_host, args.federation_port, "cert.pem", "key.pem")
+
+    if args.cdr:
+        cdr = CdrRecorder(open_cdr_sink(args.cdr))
+        cdr.start()
+
+    if args.admin_socket:
+        await ProfilerControlServer(Profiler(), args.admin_socket).start()
+
     await serve(
         "::",
-        4433,
+        args.port,
         configuration=configuration,
         create_protocol=WebTransportServerProtocol,
         stream_handler=stream_handler
     )
-    await asyncio.Future()  # Run indefinitely
+    try:
+        await asyncio.Future()  # Run indefinitely
+    finally:
+        if cdr:
+            await cdr.stop()
 
 
 if __name__ == "__main__":
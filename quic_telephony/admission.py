@@ -0,0 +1,186 @@
+import asyncio
+import logging
+import time
+import weakref
+from contextlib import asynccontextmanager
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """
+    Token bucket refilled lazily on each call to ``allow``.
+    """
+
+    __slots__ = ("rate", "burst", "tokens", "updated")
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def allow(self, now: float, cost: float = 1.0) -> bool:
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens < cost:
+            return False
+        self.tokens -= cost
+        return True
+
+
+class AdmissionController:
+    """
+    Node-wide admission control for signaling commands.
+
+    - Every command spends a token from its connection's bucket and, when it
+      names a user, from that user's bucket on the same connection. User
+      buckets are kept per connection, so no connection can spend the
+      tokens of a user registered on another.
+    - At most ``max_inflight_offers`` offers are negotiated at once, with up
+      to ``max_queued_offers`` more waiting for a slot.
+    - New work is shed once event-loop lag exceeds ``max_loop_lag`` seconds
+      or the offer queue is full, so established calls keep their latency.
+    """
+
+    def __init__(
+        self,
+        connection_rate: float = 20.0,
+        connection_burst: float = 40.0,
+        user_rate: float = 5.0,
+        user_burst: float = 10.0,
+        max_inflight_offers: int = 32,
+        max_queued_offers: int = 256,
+        max_loop_lag: float = 0.1,
+        lag_interval: float = 0.05,
+        max_users: int = 100000,
+    ):
+        self.connection_rate = connection_rate
+        self.connection_burst = connection_burst
+        self.user_rate = user_rate
+        self.user_burst = user_burst
+        self.max_inflight_offers = max_inflight_offers
+        self.max_queued_offers = max_queued_offers
+        self.max_loop_lag = max_loop_lag
+        self.lag_interval = lag_interval
+        self.max_users = max_users
+
+        self._connections: "weakref.WeakKeyDictionary[object, TokenBucket]" = weakref.WeakKeyDictionary()
+        self._users: "weakref.WeakKeyDictionary[object, Dict[str, TokenBucket]]" = weakref.WeakKeyDictionary()
+        self._offer_slots = asyncio.Semaphore(max_inflight_offers)
+        self._monitor_task: Optional[asyncio.Task] = None
+
+        self.pending_offers = 0
+        self.loop_lag = 0.0
+        self.rate_limited = 0
+        self.shed = 0
+
+    def allow_connection(self, connection) -> bool:
+        """
+        Spend one token from the bucket of a connection.
+        """
+        bucket = self._connections.get(connection)
+        if bucket is None:
+            bucket = self._connections[connection] = TokenBucket(self.connection_rate, self.connection_burst)
+        if bucket.allow(time.monotonic()):
+            return True
+        self.rate_limited += 1
+        return False
+
+    def allow_user(self, connection, user_id: str) -> bool:
+        """
+        Spend one token from the bucket of a user on a connection.
+        """
+        now = time.monotonic()
+        users = self._users.get(connection)
+        if users is None:
+            users = self._users[connection] = {}
+        bucket = users.get(user_id)
+        if bucket is None:
+            if len(users) >= self.max_users:
+                self._prune_users(users, now)
+            bucket = users[user_id] = TokenBucket(self.user_rate, self.user_burst)
+        if bucket.allow(now):
+            return True
+        self.rate_limited += 1
+        return False
+
+    @staticmethod
+    def _prune_users(users: Dict[str, TokenBucket], now: float):
+        # A bucket that would be full again carries no state worth keeping.
+        idle = [
+            user_id
+            for user_id, bucket in users.items()
+            if bucket.tokens + (now - bucket.updated) * bucket.rate >= bucket.burst
+        ]
+        for user_id in idle:
+            del users[user_id]
+
+    def overloaded(self) -> bool:
+        """
+        Whether new work should be shed.
+        """
+        return (
+            self.loop_lag > self.max_loop_lag
+            or self.pending_offers >= self.max_inflight_offers + self.max_queued_offers
+        )
+
+    def admit(self) -> bool:
+        """
+        Admit a unit of new work, or count it as shed if the node is overloaded.
+        """
+        if self.overloaded():
+            self.shed += 1
+            return False
+        return True
+
+    def reserve_offer(self) -> bool:
+        """
+        Reserve a place for an offer, or refuse it if the node is overloaded.
+
+        A successful reservation must be followed by ``offer_slot()``.
+        """
+        if not self.admit():
+            return False
+        self.pending_offers += 1
+        return True
+
+    @asynccontextmanager
+    async def offer_slot(self):
+        """
+        Wait for one of the in-flight offer slots, then release the
+        reservation made by ``reserve_offer()`` on exit.
+        """
+        try:
+            async with self._offer_slots:
+                yield
+        finally:
+            self.pending_offers -= 1
+
+    def start(self):
+        """
+        Start measuring event-loop lag.
+        """
+        if self._monitor_task is None or self._monitor_task.done():
+            self._monitor_task = asyncio.ensure_future(self._monitor())
+
+    async def stop(self):
+        if self._monitor_task:
+            self._monitor_task.cancel()
+            try:
+                await self._monitor_task
+            except asyncio.CancelledError:
+                pass
+            self._monitor_task = None
+
+    async def _monitor(self):
+        loop = asyncio.get_event_loop()
+        while True:
+            expected = loop.time() + self.lag_interval
+            await asyncio.sleep(self.lag_interval)
+            lag = max(0.0, loop.time() - expected)
+            # Rise immediately, decay by half per interval once the loop recovers.
+            self.loop_lag = max(lag, self.loop_lag / 2)
+            if lag > self.max_loop_lag:
+                logger.warning(f"Event loop lag {lag * 1000:.1f}ms, shedding new work")
@@ -0,0 +1,97 @@
+import asyncio
+import logging
+from typing import Callable, Dict
+
+logger = logging.getLogger(__name__)
+
+AsgiApplication = Callable
+
+# A stream send waits while more than this many bytes of the stream are
+# buffered unacknowledged, so a large response streams instead of queueing
+# in memory whole.
+STREAM_HIGH_WATER = 1024 * 1024
+
+
+class AsgiWebTransportSession:
+    """
+    Runs one ASGI WebTransport application instance for a session.
+
+    Sends do not transmit immediately: they ask the protocol for a transmit
+    on the next loop iteration, so every message an app sends in one pass
+    leaves in a single transmit. A ``webtransport.stream.send`` waits while
+    more than ``STREAM_HIGH_WATER`` bytes of that stream are still buffered.
+    """
+
+    def __init__(self, protocol, stream_id: int, scope: Dict, app: AsgiApplication):
+        self.protocol = protocol
+        self.stream_id = stream_id
+        self.accepted = False
+        self.closed = False
+        self.queue: asyncio.Queue[Dict] = asyncio.Queue()
+        self.queue.put_nowait({"type": "webtransport.connect"})
+        self.task = asyncio.ensure_future(self.run_asgi(app, scope))
+
+    async def run_asgi(self, app: AsgiApplication, scope: Dict):
+        """
+        Run the application until it returns, then close the session.
+        """
+        try:
+            await app(scope, self.receive, self.send)
+        except asyncio.CancelledError:
+            pass
+        except ConnectionError:
+            if not self.protocol.terminated:
+                logger.exception(f"ASGI application failed on session {self.stream_id}")
+        except Exception:
+            logger.exception(f"ASGI application failed on session {self.stream_id}")
+        finally:
+            if not self.closed and not self.protocol.terminated:
+                await self.send({"type": "webtransport.close"})
+            self.protocol.session_finished(self.stream_id)
+
+    async def receive(self) -> Dict:
+        return await self.queue.get()
+
+    async def send(self, message: Dict):
+        """
+        Translate an ASGI WebTransport message into HTTP/3 or QUIC calls.
+        """
+        if self.protocol.terminated:
+            raise ConnectionError(f"WebTransport session {self.stream_id} is closed")
+        http = self.protocol._http
+        message_type = message["type"]
+
+        if message_type == "webtransport.accept":
+            self.accepted = True
+            http.send_headers(
+                stream_id=self.stream_id,
+                headers=[
+                    (b":status", b"200"),
+                    (b"sec-webtransport-http3-draft", b"draft02"),
+                ],
+            )
+        elif message_type == "webtransport.close":
+            if self.closed:
+                return
+            self.closed = True
+            if self.accepted:
+                http.send_data(stream_id=self.stream_id, data=b"", end_stream=True)
+            else:
+                http.send_headers(
+                    stream_id=self.stream_id, headers=[(b":status", b"403")], end_stream=True
+                )
+        elif message_type == "webtransport.datagram.send":
+            http.send_datagram(stream_id=self.stream_id, data=message["data"])
+        elif message_type == "webtransport.stream.send":
+            self.protocol._quic.send_stream_data(
+                stream_id=message["stream"],
+                data=message["data"],
+                end_stream=message.get("end_stream", False),
+            )
+        else:
+            logger.warning(f"Unsupported ASGI message type: {message_type}")
+            return
+
+        self.protocol._transmit_soon()
+        if message_type == "webtransport.stream.send":
+            await self.protocol.wait_stream_drained(message["stream"], STREAM_HIGH_WATER)
@@ -0,0 +1,312 @@
+import argparse
+import asyncio
+import json
+import logging
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional, Set, Tuple
+
+from aioquic.asyncio import connect
+from aioquic.asyncio.protocol import QuicConnectionProtocol
+from aioquic.h3.connection import H3_ALPN, H3Connection
+from aioquic.h3.events import (
+    DataReceived,
+    DatagramReceived,
+    H3Event,
+    HeadersReceived,
+    WebTransportStreamDataReceived,
+)
+from aioquic.quic.configuration import QuicConfiguration
+from aioquic.quic.events import QuicEvent, StreamDataReceived
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+
+# QUIC datagrams are never fragmented, so a payload must fit in one packet of
+# aioquic's default 1200 bytes next to the packet header, AEAD tag and
+# framing. Larger ones are never sent.
+MAX_DATAGRAM_SIZE = 1150
+
+
+class BenchClientProtocol(QuicConnectionProtocol):
+    """
+    HTTP/3 client protocol driving the demo.py benchmark endpoints.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._http = H3Connection(self._quic, enable_webtransport=True)
+        self._headers: Dict[int, asyncio.Future] = {}
+        self._streams: Dict[int, asyncio.Queue] = defaultdict(asyncio.Queue)
+        self._datagrams: asyncio.Queue = asyncio.Queue()
+        self._webtransport_streams: Set[int] = set()
+
+    def quic_event_received(self, event: QuicEvent):
+        # aioquic parses replies on client-opened WebTransport bidirectional
+        # streams as HTTP/3 frames, so read those streams directly.
+        if isinstance(event, StreamDataReceived) and event.stream_id in self._webtransport_streams:
+            queue = self._streams[event.stream_id]
+            if event.data:
+                queue.put_nowait(event.data)
+            if event.end_stream:
+                queue.put_nowait(None)
+            return
+
+        for http_event in self._http.handle_event(event):
+            self.http_event_received(http_event)
+
+    def http_event_received(self, event: H3Event):
+        if isinstance(event, HeadersReceived):
+            waiter = self._headers.pop(event.stream_id, None)
+            if waiter and not waiter.done():
+                waiter.set_result(dict(event.headers))
+            if event.stream_ended:
+                self._streams[event.stream_id].put_nowait(None)
+        elif isinstance(event, DatagramReceived):
+            self._datagrams.put_nowait(event.data)
+        elif isinstance(event, (DataReceived, WebTransportStreamDataReceived)):
+            queue = self._streams[event.stream_id]
+            if event.data:
+                queue.put_nowait(event.data)
+            if event.stream_ended:
+                queue.put_nowait(None)
+
+    async def request(
+        self, authority: str, method: str, path: str, headers=None, end_stream=True
+    ) -> Tuple[int, asyncio.Future]:
+        """
+        Send request headers and wait for the response headers.
+        """
+        stream_id = self._quic.get_next_available_stream_id()
+        waiter = asyncio.get_event_loop().create_future()
+        self._headers[stream_id] = waiter
+        self._http.send_headers(
+            stream_id=stream_id,
+            headers=[
+                (b":method", method.encode()),
+                (b":scheme", b"https"),
+                (b":authority", authority.encode()),
+                (b":path", path.encode()),
+            ]
+            + (headers or []),
+            end_stream=end_stream,
+        )
+        self.transmit()
+        return stream_id, waiter
+
+    async def open_session(self, authority: str, path: str) -> int:
+        """
+        Open a WebTransport session and return its session id.
+        """
+        session_id, waiter = await self.request(
+            authority, "CONNECT", path, headers=[(b":protocol", b"webtransport")], end_stream=False
+        )
+        response = await waiter
+        if response.get(b":status") != b"200":
+            raise ConnectionError(f"WebTransport session to {path} refused: {response}")
+        return session_id
+
+    def create_stream(self, session_id: int, is_unidirectional: bool) -> int:
+        """
+        Open a WebTransport stream within a session.
+        """
+        stream_id = self._http.create_webtransport_stream(session_id, is_unidirectional=is_unidirectional)
+        if not is_unidirectional:
+            self._webtransport_streams.add(stream_id)
+        return stream_id
+
+    async def read_stream(self, stream_id: int) -> Optional[bytes]:
+        """
+        Read the next chunk from a stream, or None once it has ended.
+        """
+        return await self._streams[stream_id].get()
+
+    async def receive_datagram(self, timeout: float) -> Optional[bytes]:
+        try:
+            return await asyncio.wait_for(self._datagrams.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def send_datagram(self, session_id: int, data: bytes):
+        self._http.send_datagram(stream_id=session_id, data=data)
+        self.transmit()
+
+    async def send_stream(self, stream_id: int, total: int, end_stream: bool = True):
+        """
+        Send ``total`` generated bytes on a stream, yielding between chunks.
+        """
+        chunk = b"Z" * CHUNK_SIZE
+        remaining = total
+        while remaining > 0:
+            length = min(remaining, CHUNK_SIZE)
+            self._quic.send_stream_data(stream_id, chunk[:length], end_stream=False)
+            self.transmit()
+            remaining -= length
+            await asyncio.sleep(0)
+        if end_stream:
+            self._quic.send_stream_data(stream_id, b"", end_stream=True)
+            self.transmit()
+
+
+def summarize(mode: str, started: float, total_bytes: int, messages: int, latencies: List[float], **extra) -> Dict:
+    elapsed = time.perf_counter() - started
+    result = {
+        "mode": mode,
+        "bytes": total_bytes,
+        "messages": messages,
+        "elapsed": round(elapsed, 6),
+        "bytes_per_sec": round(total_bytes / elapsed, 1) if elapsed else 0.0,
+        "messages_per_sec": round(messages / elapsed, 1) if elapsed else 0.0,
+    }
+    if latencies:
+        latencies.sort()
+        result["latency_ms"] = {
+            "p50": round(latencies[len(latencies) // 2] * 1000, 3),
+            "p99": round(latencies[int(len(latencies) * 0.99)] * 1000, 3),
+            "max": round(latencies[-1] * 1000, 3),
+        }
+    result.update(extra)
+    return result
+
+
+async def bench_http(client: BenchClientProtocol, authority: str, size: int, count: int) -> Dict:
+    """
+    Download the streamed ``/{size}`` payload ``count`` times.
+    """
+    started = time.perf_counter()
+    total = 0
+    latencies = []
+    for _ in range(count):
+        sent = time.perf_counter()
+        stream_id, waiter = await client.request(authority, "GET", f"/{size}")
+        await waiter
+        while (data := await client.read_stream(stream_id)) is not None:
+            total += len(data)
+        latencies.append(time.perf_counter() - sent)
+    return summarize("http", started, total, count, latencies)
+
+
+async def bench_datagram(client: BenchClientProtocol, authority: str, size: int, count: int) -> Dict:
+    """
+    Ping-pong ``count`` datagrams through ``/wt/datagram``.
+    """
+    if size > MAX_DATAGRAM_SIZE:
+        raise ValueError(f"Datagram size {size} exceeds the maximum of {MAX_DATAGRAM_SIZE} bytes")
+    session_id = await client.open_session(authority, "/wt/datagram")
+    payload = b"Z" * size
+    started = time.perf_counter()
+    latencies = []
+    lost = 0
+    for _ in range(count):
+        sent = time.perf_counter()
+        client.send_datagram(session_id, payload)
+        if await client.receive_datagram(timeout=1.0) is None:
+            lost += 1
+        else:
+            latencies.append(time.perf_counter() - sent)
+    return summarize("datagram", started, len(latencies) * size, len(latencies), latencies, lost=lost)
+
+
+async def bench_echo(client: BenchClientProtocol, authority: str, size: int, count: int) -> Dict:
+    """
+    Ping-pong ``count`` messages over one bidirectional stream to ``/wt/echo``.
+    """
+    session_id = await client.open_session(authority, "/wt/echo")
+    stream_id = client.create_stream(session_id, is_unidirectional=False)
+    payload = b"Z" * size
+    started = time.perf_counter()
+    latencies = []
+    for _ in range(count):
+        sent = time.perf_counter()
+        client._quic.send_stream_data(stream_id, payload, end_stream=False)
+        client.transmit()
+        received = 0
+        while received < size:
+            data = await client.read_stream(stream_id)
+            if data is None:
+                raise ConnectionError(f"Echo stream ended after {received} of {size} bytes")
+            received += len(data)
+        latencies.append(time.perf_counter() - sent)
+    return summarize("echo", started, count * size, count, latencies)
+
+
+async def bench_sink(client: BenchClientProtocol, authority: str, size: int, count: int) -> Dict:
+    """
+    Push ``count`` unidirectional streams of ``size`` bytes to ``/wt/sink``.
+    """
+    session_id = await client.open_session(authority, "/wt/sink")
+    started = time.perf_counter()
+    for _ in range(count):
+        stream_id = client.create_stream(session_id, is_unidirectional=True)
+        await client.send_stream(stream_id, size)
+
+    # Data is buffered locally, so wait until the server has seen all of it.
+    server = None
+    deadline = time.perf_counter() + 30.0
+    while time.perf_counter() < deadline:
+        client.send_datagram(session_id, b"REPORT")
+        report = await client.receive_datagram(timeout=1.0)
+        if report:
+            server = json.loads(report)
+            if server["bytes"] >= count * size:
+                break
+        await asyncio.sleep(0.01)
+    return summarize("sink", started, count * size, count, [], server=server)
+
+
+async def bench_source(client: BenchClientProtocol, authority: str, size: int, count: int) -> Dict:
+    """
+    Pull ``count`` streams of ``size`` bytes from ``/wt/source``.
+    """
+    session_id = await client.open_session(authority, "/wt/source")
+    started = time.perf_counter()
+    total = 0
+    latencies = []
+    for _ in range(count):
+        sent = time.perf_counter()
+        stream_id = client.create_stream(session_id, is_unidirectional=False)
+        client._quic.send_stream_data(stream_id, str(size).encode(), end_stream=True)
+        client.transmit()
+        while (data := await client.read_stream(stream_id)) is not None:
+            total += len(data)
+        latencies.append(time.perf_counter() - sent)
+    return summarize("source", started, total, count, latencies)
+
+
+BENCHMARKS = {
+    "http": bench_http,
+    "datagram": bench_datagram,
+    "echo": bench_echo,
+    "sink": bench_sink,
+    "source": bench_source,
+}
+
+
+async def run(host: str, port: int, mode: str, size: int, count: int) -> Dict:
+    configuration = QuicConfiguration(
+        is_client=True, alpn_protocols=H3_ALPN, max_datagram_frame_size=65536
+    )
+    configuration.verify_mode = False  # Skip certificate verification for testing
+
+    async with connect(host, port, configuration=configuration, create_protocol=BenchClientProtocol) as client:
+        return await BENCHMARKS[mode](client, f"{host}:{port}", size, count)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the demo.py transport endpoints.")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=4433)
+    parser.add_argument("--mode", choices=sorted(BENCHMARKS), default="datagram")
+    parser.add_argument("--size", type=int, default=1000, help="payload size in bytes")
+    parser.add_argument("--count", type=int, default=1000, help="number of messages or transfers")
+    args = parser.parse_args()
+    if args.mode == "datagram" and args.size > MAX_DATAGRAM_SIZE:
+        parser.error(f"--size must be at most {MAX_DATAGRAM_SIZE} bytes in datagram mode")
+
+    result = asyncio.run(run(args.host, args.port, args.mode, args.size, args.count))
+    print(json.dumps(result))
+
+
+if __name__ == "__main__":
+    main()
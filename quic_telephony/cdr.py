@@ -0,0 +1,219 @@
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# ts, event, user_id, peer_id, duration, extra (JSON or None)
+CdrRecord = Tuple[float, str, str, Optional[str], Optional[float], Optional[str]]
+
+
+class SqliteCdrSink:
+    """
+    Appends records to an SQLite database in WAL mode.
+
+    The connection is opened lazily by the writer thread and only used from
+    that thread.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._db: Optional[sqlite3.Connection] = None
+
+    def write(self, records: List[CdrRecord]):
+        if self._db is None:
+            self._db = sqlite3.connect(self.path)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS cdr ("
+                "ts REAL, event TEXT, user_id TEXT, peer_id TEXT, duration REAL, extra TEXT)"
+            )
+        with self._db:
+            self._db.executemany("INSERT INTO cdr VALUES (?, ?, ?, ?, ?, ?)", records)
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+
+class JsonlCdrSink:
+    """
+    Appends records to newline-delimited JSON files in ``directory``,
+    starting a new file once the current one reaches ``max_bytes``.
+    """
+
+    def __init__(self, directory: str, max_bytes: int = 64 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._fp = None
+
+    def _open(self):
+        os.makedirs(self.directory, exist_ok=True)
+        name = time.strftime("cdr-%Y%m%d-%H%M%S")
+        path = os.path.join(self.directory, f"{name}.jsonl")
+        suffix = 1
+        while os.path.exists(path):
+            path = os.path.join(self.directory, f"{name}-{suffix}.jsonl")
+            suffix += 1
+        self._fp = open(path, "a")
+
+    def write(self, records: List[CdrRecord]):
+        if self._fp is None or self._fp.tell() >= self.max_bytes:
+            self.close()
+            self._open()
+        lines = []
+        for ts, event, user_id, peer_id, duration, extra in records:
+            record = {"ts": ts, "event": event, "user": user_id}
+            if peer_id is not None:
+                record["peer"] = peer_id
+            if duration is not None:
+                record["duration"] = duration
+            if extra is not None:
+                record["stats"] = json.loads(extra)
+            lines.append(json.dumps(record, separators=(",", ":")))
+        self._fp.write("\n".join(lines) + "\n")
+        self._fp.flush()
+
+    def close(self):
+        if self._fp is not None:
+            self._fp.close()
+            self._fp = None
+
+
+def open_cdr_sink(target: str):
+    """
+    Pick a sink from a target path: ``*.db`` or ``*.sqlite`` for SQLite,
+    anything else is a directory of JSON lines files.
+    """
+    if target.endswith((".db", ".sqlite")):
+        return SqliteCdrSink(target)
+    return JsonlCdrSink(target)
+
+
+class CdrRecorder:
+    """
+    Buffers call detail records in memory and writes them in batches.
+
+    Recording a record only appends a tuple to a list. A background task
+    hands full batches, or whatever is buffered every ``flush_interval``
+    seconds, to a single writer thread, so the event loop never touches the
+    disk. At most ``max_buffer`` records are held; further records are
+    dropped and counted in ``dropped``.
+    """
+
+    def __init__(
+        self,
+        sink,
+        max_buffer: int = 10000,
+        batch_size: int = 500,
+        flush_interval: float = 1.0,
+        max_calls: int = 100000,
+    ):
+        self.sink = sink
+        self.max_buffer = max_buffer
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_calls = max_calls
+        self.dropped = 0
+        self.written = 0
+        self._buffer: List[CdrRecord] = []
+        self._calls: Dict[Tuple[str, ...], List[Optional[float]]] = {}
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="cdr-writer")
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+
+    @staticmethod
+    def _call_key(user_id: str, peer_id: Optional[str]) -> Tuple[str, ...]:
+        return tuple(sorted(filter(None, (user_id, peer_id))))
+
+    def _append(self, record: CdrRecord):
+        if len(self._buffer) >= self.max_buffer:
+            self.dropped += 1
+            return
+        self._buffer.append(record)
+        if len(self._buffer) >= self.batch_size and self._wakeup is not None:
+            self._wakeup.set()
+
+    def register(self, user_id: str):
+        self._append((time.time(), "register", user_id, None, None, None))
+
+    def call_start(self, user_id: str, peer_id: Optional[str] = None):
+        now = time.time()
+        if len(self._calls) >= self.max_calls:
+            # Forget the oldest call that never saw a BYE.
+            del self._calls[next(iter(self._calls))]
+        self._calls[self._call_key(user_id, peer_id)] = [now, None]
+        self._append((now, "call_start", user_id, peer_id, None, None))
+
+    def answer(self, user_id: str, peer_id: Optional[str] = None):
+        now = time.time()
+        call = self._calls.get(self._call_key(user_id, peer_id))
+        if call is not None and call[1] is None:
+            call[1] = now
+        setup = now - call[0] if call is not None else None
+        self._append((now, "answer", user_id, peer_id, setup, None))
+
+    def has_call(self, user_id: str, peer_id: Optional[str] = None) -> bool:
+        """
+        Whether a call between the two users started here and has not ended.
+        """
+        return self._call_key(user_id, peer_id) in self._calls
+
+    def bye(self, user_id: str, peer_id: Optional[str] = None, stats: Optional[Dict] = None):
+        """
+        Record the end of a call. The duration runs from the answer, or from
+        the start if the call was never answered.
+        """
+        now = time.time()
+        call = self._calls.pop(self._call_key(user_id, peer_id), None)
+        duration = now - (call[1] or call[0]) if call is not None else None
+        extra = json.dumps(stats, separators=(",", ":")) if stats else None
+        self._append((now, "bye", user_id, peer_id, duration, extra))
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._stopping = False
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        """
+        Stop the background task, write out everything buffered and close
+        the sink. A batch the task is writing is waited for, not abandoned.
+        """
+        if self._task:
+            self._stopping = True
+            self._wakeup.set()
+            await self._task
+            self._task = None
+        await self.flush()
+        await asyncio.get_event_loop().run_in_executor(self._executor, self.sink.close)
+        self._executor.shutdown(wait=False)
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    async def flush(self):
+        if not self._buffer:
+            return
+        batch, self._buffer = self._buffer, []
+        try:
+            await asyncio.get_event_loop().run_in_executor(self._executor, self.sink.write, batch)
+            self.written += len(batch)
+        except Exception as e:
+            self.dropped += len(batch)
+            logger.error(f"Failed to write {len(batch)} call detail records: {e}")
@@ -0,0 +1,448 @@
+import asyncio
+import bisect
+import functools
+import hashlib
+import hmac
+import itertools
+import json
+import logging
+import struct
+from contextlib import AsyncExitStack
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from aioquic.asyncio import connect, serve
+from aioquic.asyncio.protocol import QuicConnectionProtocol
+from aioquic.quic.configuration import QuicConfiguration
+from aioquic.quic.events import QuicEvent, StreamDataReceived
+from aioquic.quic.packet import QuicErrorCode
+
+logger = logging.getLogger(__name__)
+
+FEDERATION_ALPN = "quic-telephony-federation"
+FRAME_HEADER = struct.Struct("!I")
+MAX_FRAME_SIZE = 1024 * 1024
+
+
+class HashRing:
+    """
+    Consistent hash ring mapping user ids to node names.
+    """
+
+    def __init__(self, nodes: List[str], replicas: int = 64):
+        self._ring: List[Tuple[int, str]] = sorted(
+            (self._hash(f"{node}#{i}"), node) for node in nodes for i in range(replicas)
+        )
+        self._keys = [key for key, _ in self._ring]
+
+    @staticmethod
+    def _hash(value: str) -> int:
+        return int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), "big")
+
+    def node_for(self, key: str) -> str:
+        index = bisect.bisect(self._keys, self._hash(key)) % len(self._keys)
+        return self._ring[index][1]
+
+
+class FederationProtocol(QuicConnectionProtocol):
+    """
+    QUIC protocol for inter-node links.
+
+    Each stream carries frames of a 4-byte length followed by a JSON list of
+    messages, which are handed to the node as one batch. When the node has a
+    secret, the first frame on an inbound link must be a ``hello`` from a
+    configured peer carrying that secret; otherwise the link is closed. A
+    frame longer than the node's ``max_frame_size`` also closes the link.
+    """
+
+    def __init__(self, *args, node: "FederationNode" = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.node = node
+        self.authenticated = node.secret is None
+        self.rejected = False
+        self._buffers: Dict[int, bytearray] = {}
+
+    def quic_event_received(self, event: QuicEvent):
+        if not isinstance(event, StreamDataReceived) or self.rejected:
+            return
+        buffer = self._buffers.setdefault(event.stream_id, bytearray())
+        buffer += event.data
+        while len(buffer) >= FRAME_HEADER.size:
+            (length,) = FRAME_HEADER.unpack_from(buffer)
+            if length > self.node.max_frame_size:
+                self.reject(f"frame of {length} bytes is over the limit")
+                return
+            if len(buffer) < FRAME_HEADER.size + length:
+                break
+            frame = bytes(buffer[FRAME_HEADER.size:FRAME_HEADER.size + length])
+            del buffer[:FRAME_HEADER.size + length]
+            try:
+                messages = json.loads(frame)
+                if self.authenticated:
+                    self.node.handle_batch(messages)
+                elif not self.authenticate(messages):
+                    self.reject("peer did not authenticate")
+                    return
+            except Exception as e:
+                logger.error(f"Error processing federation batch: {e}")
+        if event.end_stream:
+            self._buffers.pop(event.stream_id, None)
+
+    def authenticate(self, messages: List[Dict]) -> bool:
+        single = isinstance(messages, list) and len(messages) == 1 and isinstance(messages[0], dict)
+        hello = messages[0] if single else {}
+        if (
+            hello.get("t") == "hello"
+            and hello.get("node") in self.node.peers
+            and hmac.compare_digest(str(hello.get("secret", "")).encode(), self.node.secret.encode())
+        ):
+            self.authenticated = True
+            logger.info(f"Federation link from {hello['node']} authenticated")
+        return self.authenticated
+
+    def reject(self, reason: str):
+        logger.warning(f"Closing federation link: {reason}")
+        self.rejected = True
+        self._buffers.clear()
+        self._quic.close(error_code=QuicErrorCode.CONNECTION_REFUSED, reason_phrase=reason)
+        self.transmit()
+
+
+class FederationPeer:
+    """
+    Persistent outbound link to one peer node.
+
+    Messages queued during one loop iteration are flushed together, split
+    into frames of at most the node's ``max_frame_size``. A message too large
+    for any frame is dropped. While the link is down, up to ``max_pending``
+    messages are kept and the oldest are dropped beyond that.
+    """
+
+    def __init__(self, node: "FederationNode", name: str, host: str, port: int, max_pending: int = 10000):
+        self.node = node
+        self.name = name
+        self.host = host
+        self.port = port
+        self.max_pending = max_pending
+        self.pending: List[Dict] = []
+        self.dropped = 0
+        self._protocol: Optional[FederationProtocol] = None
+        self._stream_id: Optional[int] = None
+        self._flush_scheduled = False
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def connected(self) -> bool:
+        return self._protocol is not None
+
+    def send(self, message: Dict):
+        self.pending.append(message)
+        if len(self.pending) > self.max_pending:
+            del self.pending[0]
+            self.dropped += 1
+        if not self._flush_scheduled and self.connected:
+            self._flush_scheduled = True
+            asyncio.get_event_loop().call_soon(self.flush)
+
+    def flush(self):
+        self._flush_scheduled = False
+        if not self.pending or not self.connected:
+            return
+        messages, self.pending = self.pending, []
+        limit = self.node.max_frame_size
+        frame: List[bytes] = []
+        size = 2
+        for message in messages:
+            encoded = json.dumps(message, separators=(",", ":")).encode()
+            if len(encoded) + 2 > limit:
+                self.dropped += 1
+                logger.warning(f"Dropping {len(encoded)}-byte federation message for {self.name}")
+                continue
+            if frame and size + len(encoded) + 1 > limit:
+                self.write_frame(frame)
+                frame, size = [], 2
+            frame.append(encoded)
+            size += len(encoded) + 1
+        if frame:
+            self.write_frame(frame)
+        self._protocol.transmit()
+
+    def write_frame(self, messages: List[bytes]):
+        data = b"[" + b",".join(messages) + b"]"
+        self._protocol._quic.send_stream_data(self._stream_id, FRAME_HEADER.pack(len(data)) + data)
+
+    def start(self):
+        self._task = asyncio.ensure_future(self.run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def run(self):
+        """
+        Keep the link up, reconnecting with exponential backoff.
+        """
+        delay = 0.5
+        while True:
+            try:
+                async with AsyncExitStack() as stack:
+                    protocol = await asyncio.wait_for(
+                        stack.enter_async_context(
+                            connect(
+                                self.host,
+                                self.port,
+                                configuration=self.node.client_configuration(),
+                                create_protocol=functools.partial(FederationProtocol, node=self.node),
+                            )
+                        ),
+                        timeout=self.node.keepalive,
+                    )
+                    self._protocol = protocol
+                    self._stream_id = protocol._quic.get_next_available_stream_id()
+                    if self.node.secret is not None:
+                        hello = {"t": "hello", "node": self.node.name, "secret": self.node.secret}
+                        self.write_frame([json.dumps(hello).encode()])
+                    delay = 0.5
+                    logger.info(f"Federation link to {self.name} established")
+                    self.node.link_established(self.name)
+                    self.flush()
+                    while True:
+                        await asyncio.sleep(self.node.keepalive)
+                        await asyncio.wait_for(protocol.ping(), timeout=self.node.keepalive)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Federation link to {self.name} failed: {e}")
+            finally:
+                connected = self.connected
+                self._protocol = None
+                self._stream_id = None
+                if connected:
+                    self.node.link_lost(self.name)
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 10.0)
+
+
+class FederationNode:
+    """
+    Routes signaling messages to users connected to other nodes.
+
+    Every user has a home node chosen by consistent hashing. The home node
+    stores which node the user is connected to. A message for a user who is
+    not connected locally goes to that user's home node, which forwards it
+    to the node holding the user, so delivery takes at most two hops.
+
+    ``deliver(user_id, message)`` hands a message to a local user and returns
+    False if the user is not connected here.
+
+    Outbound links verify the peer's certificate against ``ca_file`` when it
+    is given. Inbound links are trusted only after the dialing peer presents
+    ``secret``, if one is set, and messages naming nodes that are not
+    configured are ignored.
+
+    A routed message can carry a callback that runs once the message has
+    been delivered. The delivering node acknowledges it back to the origin.
+    At most ``max_callbacks`` callbacks wait for acknowledgement; the
+    oldest are forgotten beyond that.
+
+    While the link to a peer is down, messages that would route through it
+    fail right away with an ERROR to the sender, and users located on it are
+    forgotten. When the link comes back, the peer is asked to announce its
+    users again.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        peers: Dict[str, Tuple[str, int]],
+        deliver: Callable[[str, str], bool],
+        ca_file: Optional[str] = None,
+        keepalive: float = 15.0,
+        max_callbacks: int = 10000,
+        secret: Optional[str] = None,
+        max_frame_size: int = MAX_FRAME_SIZE,
+    ):
+        self.name = name
+        self.deliver = deliver
+        self.ca_file = ca_file
+        self.secret = secret
+        self.max_frame_size = max_frame_size
+        self.keepalive = keepalive
+        self.ring = HashRing([name] + list(peers))
+        self.peers = {
+            peer_name: FederationPeer(self, peer_name, host, port)
+            for peer_name, (host, port) in peers.items()
+        }
+        self.local_users: Set[str] = set()
+        self.locations: Dict[str, str] = {}
+        self.max_callbacks = max_callbacks
+        self._callbacks: Dict[int, Callable[[], None]] = {}
+        self._callback_ids = itertools.count()
+        self._server = None
+
+    def client_configuration(self) -> QuicConfiguration:
+        configuration = QuicConfiguration(
+            is_client=True, alpn_protocols=[FEDERATION_ALPN], idle_timeout=self.keepalive * 4
+        )
+        if self.ca_file:
+            configuration.load_verify_locations(self.ca_file)
+        else:
+            configuration.verify_mode = False  # Skip certificate verification for testing
+        return configuration
+
+    async def start(self, host: str, port: int, certificate: str, private_key: str):
+        """
+        Listen for inbound links and dial every peer.
+        """
+        configuration = QuicConfiguration(
+            is_client=False, alpn_protocols=[FEDERATION_ALPN], idle_timeout=self.keepalive * 4
+        )
+        configuration.load_cert_chain(certfile=certificate, keyfile=private_key)
+        self._server = await serve(
+            host,
+            port,
+            configuration=configuration,
+            create_protocol=functools.partial(FederationProtocol, node=self),
+        )
+        for peer in self.peers.values():
+            peer.start()
+
+    async def stop(self):
+        for peer in self.peers.values():
+            await peer.stop()
+        if self._server:
+            self._server.close()
+            self._server = None
+
+    def send(self, node: str, message: Dict):
+        if node == self.name:
+            self.handle_batch([message])
+        elif message["t"] in ("route", "deliver") and not self.peers[node].connected:
+            self.undeliverable(message)
+        else:
+            self.peers[node].send(message)
+
+    def register(self, user_id: str):
+        """
+        Record that a user is connected to this node.
+        """
+        self.local_users.add(user_id)
+        self.send(self.ring.node_for(user_id), {"t": "loc", "user": user_id, "node": self.name})
+
+    def unregister(self, user_id: str):
+        """
+        Record that a user has left this node.
+        """
+        if user_id in self.local_users:
+            self.local_users.discard(user_id)
+            self.send(self.ring.node_for(user_id), {"t": "loc", "user": user_id, "node": None, "from": self.name})
+
+    def route(
+        self, sender: str, target: str, message: str, on_delivered: Optional[Callable[[], None]] = None
+    ):
+        """
+        Send a message to a user that is not connected to this node.
+
+        ``on_delivered`` is called once the target's node has delivered it.
+        If the target is not connected anywhere, the sender gets an ERROR
+        instead and the callback is dropped.
+        """
+        routed = {"t": "route", "user": target, "msg": message, "sender": sender, "origin": self.name}
+        if on_delivered is not None:
+            if len(self._callbacks) >= self.max_callbacks:
+                del self._callbacks[next(iter(self._callbacks))]
+            routed["id"] = next(self._callback_ids)
+            self._callbacks[routed["id"]] = on_delivered
+        self.send(self.ring.node_for(target), routed)
+
+    def link_established(self, peer_name: str):
+        """
+        Re-announce local users homed on a peer whose link just came up,
+        in case the peer restarted and lost its location entries, and ask
+        the peer to do the same for users homed here.
+        """
+        self.announce(peer_name)
+        self.peers[peer_name].send({"t": "sync", "from": self.name})
+
+    def announce(self, peer_name: str):
+        for user_id in self.local_users:
+            if self.ring.node_for(user_id) == peer_name:
+                self.peers[peer_name].send({"t": "loc", "user": user_id, "node": self.name})
+
+    def link_lost(self, peer_name: str):
+        """
+        Forget users located on a peer whose link went down, and fail the
+        messages still queued for it, so senders get an ERROR instead of
+        waiting on a peer that may not come back.
+        """
+        for user_id in [user_id for user_id, node in self.locations.items() if node == peer_name]:
+            del self.locations[user_id]
+        peer = self.peers[peer_name]
+        queued, peer.pending = peer.pending, []
+        for message in queued:
+            if message["t"] in ("route", "deliver"):
+                self.undeliverable(message)
+            else:
+                peer.pending.append(message)
+
+    def is_node(self, name: Optional[str]) -> bool:
+        return name == self.name or name in self.peers
+
+    def names_known_nodes(self, message: Dict) -> bool:
+        kind = message["t"]
+        if kind == "loc":
+            return (message["node"] is None or self.is_node(message["node"])) and (
+                "from" not in message or self.is_node(message["from"])
+            )
+        if kind in ("route", "deliver"):
+            return self.is_node(message["origin"])
+        if kind == "sync":
+            return message["from"] in self.peers
+        return True
+
+    def handle_batch(self, messages: List[Dict]):
+        for message in messages:
+            kind = message["t"]
+            if not self.names_known_nodes(message):
+                logger.warning(f"Ignoring federation {kind} message naming an unknown node")
+            elif kind == "loc":
+                self.handle_location(message)
+            elif kind == "route":
+                node = self.locations.get(message["user"])
+                if node is None:
+                    self.undeliverable(message)
+                else:
+                    self.send(node, dict(message, t="deliver"))
+            elif kind == "deliver":
+                if not self.deliver(message["user"], message["msg"]):
+                    self.undeliverable(message)
+                elif "id" in message:
+                    self.send(message["origin"], {"t": "ack", "id": message["id"]})
+            elif kind == "ack":
+                callback = self._callbacks.pop(message["id"], None)
+                if callback is not None:
+                    callback()
+            elif kind == "error":
+                self._callbacks.pop(message.get("id"), None)
+                self.deliver(message["user"], message["msg"])
+            elif kind == "sync":
+                self.announce(message["from"])
+            else:
+                logger.warning(f"Unknown federation message: {kind}")
+
+    def handle_location(self, message: Dict):
+        user_id = message["user"]
+        if message["node"] is not None:
+            self.locations[user_id] = message["node"]
+        elif self.locations.get(user_id) == message["from"]:
+            del self.locations[user_id]
+
+    def undeliverable(self, message: Dict):
+        error = {"t": "error", "user": message["sender"], "msg": f"ERROR User {message['user']} not found"}
+        if "id" in message:
+            error["id"] = message["id"]
+        self.send(message["origin"], error)
@@ -0,0 +1,120 @@
+import logging
+from typing import List, Optional
+
+from aiortc import RTCConfiguration, RTCPeerConnection, RTCSessionDescription
+
+logger = logging.getLogger(__name__)
+
+# Private attributes of aioice.Connection that ``IceLiteConfig.gather``
+# relies on. They are checked before use, because aioice does not promise them.
+_CONNECTION_ATTRIBUTES = (
+    "_local_candidates",
+    "_local_candidates_start",
+    "_local_candidates_end",
+    "_components",
+    "get_component_candidates",
+)
+
+
+class IceLiteConfig:
+    """
+    Server-side ICE settings for a node with a known address.
+
+    Peer connections built with this config do not query STUN or TURN, and
+    they bind host candidates only on ``host_addresses`` instead of on every
+    interface. Gathering then finishes as soon as those sockets are bound,
+    so ``createAnswer`` does not wait on candidate discovery. When the node
+    sits behind a 1:1 NAT, ``advertised_address`` replaces the bound address
+    in the candidates sent to clients. With ``advertise_lite`` set, answers
+    carry ``a=ice-lite``, so clients always take the controlling role.
+    """
+
+    def __init__(
+        self,
+        host_addresses: List[str],
+        advertised_address: Optional[str] = None,
+        advertise_lite: bool = True,
+    ):
+        if not host_addresses:
+            raise ValueError("At least one host address is required")
+        self.host_addresses = host_addresses
+        self.advertised_address = advertised_address
+        self.advertise_lite = advertise_lite
+
+    def rtc_configuration(self) -> RTCConfiguration:
+        # An empty list, unlike None, keeps aiortc from adding its default STUN server.
+        return RTCConfiguration(iceServers=[])
+
+    async def gather(self, peer_connection: RTCPeerConnection):
+        """
+        Gather host candidates on the configured addresses only.
+
+        Must run after ``setRemoteDescription``, once the transports that
+        survive bundling are known, and before ``setLocalDescription``, which
+        then finds gathering already complete. If the installed aioice does
+        not have the internals this needs, gathering is left to aiortc, which
+        binds every interface but still makes no STUN or TURN lookups.
+        """
+        transports = {
+            transceiver.receiver.transport.transport for transceiver in peer_connection.getTransceivers()
+        }
+        if peer_connection.sctp:
+            transports.add(peer_connection.sctp.transport.transport)
+
+        for ice_transport in transports:
+            connection = getattr(ice_transport.iceGatherer, "_connection", None)
+            if not all(hasattr(connection, name) for name in _CONNECTION_ATTRIBUTES):
+                logger.warning("aioice internals not found, falling back to normal candidate gathering")
+                return
+            if connection._local_candidates_start:
+                continue
+            connection._local_candidates_start = True
+            for component in connection._components:
+                candidates = await connection.get_component_candidates(
+                    component=component, addresses=self.host_addresses
+                )
+                if self.advertised_address:
+                    for candidate in candidates:
+                        candidate.host = self.advertised_address
+                connection._local_candidates += candidates
+            connection._local_candidates_end = True
+
+    def apply_to_answer(self, sdp: str) -> str:
+        """
+        Mark an answer as coming from an ICE-lite agent.
+        """
+        if not self.advertise_lite or "a=ice-lite" in sdp:
+            return sdp
+        lines = sdp.split("\r\n")
+        # Session-level attribute: it must precede the first media section.
+        index = next((i for i, line in enumerate(lines) if line.startswith("m=")), len(lines))
+        lines.insert(index, "a=ice-lite")
+        return "\r\n".join(lines)
+
+
+def create_peer_connection(ice_config: Optional[IceLiteConfig] = None) -> RTCPeerConnection:
+    """
+    Create a server-side peer connection, in fast-path mode if configured.
+    """
+    if ice_config:
+        return RTCPeerConnection(configuration=ice_config.rtc_configuration())
+    return RTCPeerConnection()
+
+
+async def create_answer(
+    peer_connection: RTCPeerConnection, sdp: str, ice_config: Optional[IceLiteConfig] = None
+) -> str:
+    """
+    Apply an SDP offer and return the SDP answer.
+    """
+    offer = RTCSessionDescription(sdp=sdp, type="offer")
+    await peer_connection.setRemoteDescription(offer)
+    if ice_config:
+        await ice_config.gather(peer_connection)
+    answer = await peer_connection.createAnswer()
+    await peer_connection.setLocalDescription(answer)
+
+    answer_sdp = peer_connection.localDescription.sdp
+    if ice_config:
+        answer_sdp = ice_config.apply_to_answer(answer_sdp)
+    return answer_sdp
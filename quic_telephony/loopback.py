@@ -0,0 +1,518 @@
+import argparse
+import asyncio
+import functools
+import heapq
+import importlib
+import inspect
+import itertools
+import json
+import logging
+import random
+import ssl
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from aioquic.asyncio.protocol import QuicConnectionProtocol
+from aioquic.buffer import Buffer
+from aioquic.h3.connection import H3_ALPN, H3Connection
+from aioquic.h3.events import DatagramReceived, HeadersReceived, WebTransportStreamDataReceived
+from aioquic.quic.configuration import QuicConfiguration
+from aioquic.quic.connection import QuicConnection
+from aioquic.quic.events import HandshakeCompleted, QuicEvent
+from aioquic.quic.packet import pull_quic_header
+from aiortc import RTCConfiguration, RTCPeerConnection
+
+from quic_telephony.ice import IceLiteConfig
+
+logger = logging.getLogger(__name__)
+
+Address = Tuple[str, int]
+
+SERVER_ADDRESS: Address = ("10.0.0.1", 4433)
+
+# Opaque SDP for servers that only relay offers and answers.
+SAMPLE_SDP = "v=0\r\no=- 0 0 IN IP4 127.0.0.1\r\ns=-\r\nt=0 0\r\n"
+
+
+class _ScheduledCall:
+    __slots__ = ("callback", "args", "cancelled")
+
+    def __init__(self, callback: Callable, args: tuple):
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class SimulatedClock:
+    """
+    Stands in for the event loop of the protocols under test.
+
+    ``time()``, ``call_at()`` and ``call_soon()`` run on simulated time, so
+    QUIC timers and packet deliveries only happen when the harness steps
+    the clock. Futures still come from the real event loop.
+
+    Calls are never scheduled less than ``resolution`` seconds ahead. Time
+    passes between loop iterations in real life too, and a QUIC timer that
+    re-arms for the current instant (aioquic does this while an ACK cannot
+    be sent yet) would otherwise stall the clock.
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, resolution: float = 0.001):
+        self.now = 0.0
+        self.resolution = resolution
+        self._loop = loop
+        self._calls: List[Tuple[float, int, _ScheduledCall]] = []
+        self._sequence = itertools.count()
+
+    def time(self) -> float:
+        return self.now
+
+    def call_at(self, when: float, callback: Callable, *args) -> _ScheduledCall:
+        call = _ScheduledCall(callback, args)
+        when = max(when, self.now + self.resolution)
+        heapq.heappush(self._calls, (when, next(self._sequence), call))
+        return call
+
+    def call_later(self, delay: float, callback: Callable, *args) -> _ScheduledCall:
+        return self.call_at(self.now + delay, callback, *args)
+
+    def call_soon(self, callback: Callable, *args) -> _ScheduledCall:
+        return self.call_at(self.now, callback, *args)
+
+    def create_future(self) -> asyncio.Future:
+        return self._loop.create_future()
+
+    def step(self, deadline: float) -> bool:
+        """
+        Run the next scheduled call due by ``deadline``, advancing the clock
+        to it. Returns False if there is none.
+        """
+        while self._calls:
+            when, _, call = self._calls[0]
+            if call.cancelled:
+                heapq.heappop(self._calls)
+                continue
+            if when > deadline:
+                return False
+            heapq.heappop(self._calls)
+            self.now = max(self.now, when)
+            call.callback(*call.args)
+            return True
+        return False
+
+
+class LoopbackNetwork:
+    """
+    Carries datagrams between endpoints on a ``SimulatedClock``.
+
+    Every datagram takes ``delay`` seconds plus up to ``jitter`` more. A
+    fraction ``loss`` of datagrams is dropped, and a fraction ``reorder`` is
+    held back for an extra ``delay`` so that later datagrams overtake it.
+    All randomness comes from a generator seeded with ``seed``.
+    """
+
+    def __init__(
+        self,
+        clock: SimulatedClock,
+        delay: float = 0.01,
+        jitter: float = 0.0,
+        loss: float = 0.0,
+        reorder: float = 0.0,
+        seed: int = 0,
+    ):
+        self.clock = clock
+        self.delay = delay
+        self.jitter = jitter
+        self.loss = loss
+        self.reorder = reorder
+        self.random = random.Random(seed)
+        self.endpoints: Dict[Address, Callable[[bytes, Address], None]] = {}
+        self.in_flight = 0
+        self.sent = 0
+        self.lost = 0
+
+    def send(self, data: bytes, source: Address, destination: Address):
+        # Always draw the same numbers per datagram, so runs with the same
+        # seed see the same losses whatever the settings.
+        lost, jitter, reordered = self.random.random(), self.random.random(), self.random.random()
+        self.sent += 1
+        if lost < self.loss:
+            self.lost += 1
+            return
+        latency = self.delay + jitter * self.jitter
+        if reordered < self.reorder:
+            latency += self.delay
+        self.in_flight += 1
+        self.clock.call_later(latency, self._deliver, data, source, destination)
+
+    def _deliver(self, data: bytes, source: Address, destination: Address):
+        self.in_flight -= 1
+        self.endpoints[destination](data, source)
+
+
+class _LoopbackTransport(asyncio.DatagramTransport):
+    def __init__(self, network: LoopbackNetwork, address: Address):
+        super().__init__()
+        self.network = network
+        self.address = address
+
+    def sendto(self, data: bytes, addr: Address = None):
+        self.network.send(data, self.address, addr)
+
+    def get_extra_info(self, name, default=None):
+        return self.address if name == "sockname" else default
+
+    def close(self):
+        pass
+
+
+class LoopbackClient(QuicConnectionProtocol):
+    """
+    WebTransport signaling client for the loopback harness.
+
+    Everything received on the session, as datagrams or stream data, is
+    appended to ``received`` as text. Datagrams are followed by a newline.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._http = H3Connection(self._quic, enable_webtransport=True)
+        self.handshake_completed = False
+        self.session_id: Optional[int] = None
+        self.status: Optional[bytes] = None
+        self.received = ""
+
+    def quic_event_received(self, event: QuicEvent):
+        if isinstance(event, HandshakeCompleted):
+            self.handshake_completed = True
+        for http_event in self._http.handle_event(event):
+            if isinstance(http_event, HeadersReceived) and http_event.stream_id == self.session_id:
+                self.status = dict(http_event.headers).get(b":status")
+            elif isinstance(http_event, DatagramReceived):
+                self.received += http_event.data.decode() + "\n"
+            elif isinstance(http_event, WebTransportStreamDataReceived):
+                self.received += http_event.data.decode()
+
+    def open_session(self, path: str = "/"):
+        self.session_id = self._quic.get_next_available_stream_id()
+        self._http.send_headers(
+            stream_id=self.session_id,
+            headers=[
+                (b":method", b"CONNECT"),
+                (b":scheme", b"https"),
+                (b":authority", b"localhost"),
+                (b":path", path.encode()),
+                (b":protocol", b"webtransport"),
+            ],
+        )
+        self.transmit()
+
+    def send(self, message: str, via: str = "datagram"):
+        """
+        Send a signaling message as a datagram or on a new unidirectional stream.
+        """
+        if via == "datagram":
+            self._http.send_datagram(self.session_id, message.encode())
+        else:
+            stream_id = self._http.create_webtransport_stream(self.session_id, is_unidirectional=True)
+            self._quic.send_stream_data(stream_id, message.encode(), end_stream=True)
+        self.transmit()
+
+
+class LoopbackHarness:
+    """
+    Runs a WebTransport server protocol against in-memory clients.
+
+    Client and server ``QuicConnection`` objects exchange datagrams over a
+    ``LoopbackNetwork`` instead of sockets, and the protocols see a
+    ``SimulatedClock`` instead of the event loop, so a run with the same
+    seed sends the same packets and loses the same ones.
+
+    ``create_protocol(connection)`` builds the server protocol for each new
+    client, like the ``create_protocol`` argument of ``aioquic.asyncio.serve``.
+    While the server is running tasks of its own (handlers that keep them in
+    a ``tasks`` set, such as SDP negotiation), the simulated clock is held
+    still and the harness waits for them in real time.
+
+    CPU time spent by the server receiving packets is accumulated in
+    ``server_cpu``, except during ``connect()``, where it goes to
+    ``handshake_cpu``.
+    """
+
+    def __init__(
+        self,
+        create_protocol: Callable[[QuicConnection], QuicConnectionProtocol],
+        certificate: str = "cert.pem",
+        private_key: str = "key.pem",
+        delay: float = 0.01,
+        jitter: float = 0.0,
+        loss: float = 0.0,
+        reorder: float = 0.0,
+        seed: int = 0,
+        task_timeout: float = 30.0,
+    ):
+        self.create_protocol = create_protocol
+        self.task_timeout = task_timeout
+        self.clock = SimulatedClock(asyncio.get_event_loop())
+        self.network = LoopbackNetwork(self.clock, delay, jitter, loss, reorder, seed)
+        self.network.endpoints[SERVER_ADDRESS] = self._server_datagram_received
+
+        self.server_configuration = QuicConfiguration(
+            is_client=False, alpn_protocols=H3_ALPN, max_datagram_frame_size=65536
+        )
+        self.server_configuration.load_cert_chain(certfile=certificate, keyfile=private_key)
+
+        self.servers: Dict[Address, QuicConnectionProtocol] = {}
+        self.clients: List[LoopbackClient] = []
+        self.messages = 0
+        self.server_cpu = 0.0
+        self.handshake_cpu = 0.0
+
+    def _server_datagram_received(self, data: bytes, address: Address):
+        protocol = self.servers.get(address)
+        if protocol is None:
+            header = pull_quic_header(
+                Buffer(data=data), host_cid_length=self.server_configuration.connection_id_length
+            )
+            connection = QuicConnection(
+                configuration=self.server_configuration,
+                original_destination_connection_id=header.destination_cid,
+            )
+            protocol = self.servers[address] = self.create_protocol(connection)
+            protocol._loop = self.clock
+            protocol.connection_made(_LoopbackTransport(self.network, SERVER_ADDRESS))
+
+        started = time.process_time()
+        protocol.datagram_received(data, address)
+        self.server_cpu += time.process_time() - started
+
+    async def connect(self, path: str = "/", timeout: float = 10.0) -> LoopbackClient:
+        """
+        Connect a new client and open a WebTransport session.
+        """
+        configuration = QuicConfiguration(
+            is_client=True, alpn_protocols=H3_ALPN, max_datagram_frame_size=65536, server_name="localhost"
+        )
+        configuration.verify_mode = ssl.CERT_NONE
+        address = ("10.0.1.1", 50000 + len(self.clients))
+
+        client = LoopbackClient(QuicConnection(configuration=configuration))
+        client._loop = self.clock
+        client.connection_made(_LoopbackTransport(self.network, address))
+        self.network.endpoints[address] = client.datagram_received
+        self.clients.append(client)
+
+        server_cpu = self.server_cpu
+        client.connect(SERVER_ADDRESS)
+        await self.run_until(lambda: client.handshake_completed, timeout)
+        client.open_session(path)
+        await self.run_until(lambda: client.status is not None, timeout)
+        self.handshake_cpu += self.server_cpu - server_cpu
+        self.server_cpu = server_cpu
+        if client.status != b"200":
+            raise ConnectionError(f"WebTransport session refused with status {client.status.decode()}")
+        return client
+
+    async def exchange(
+        self,
+        sender: LoopbackClient,
+        message: str,
+        receiver: Optional[LoopbackClient] = None,
+        expected: str = "",
+        via: str = "datagram",
+        timeout: float = 10.0,
+    ):
+        """
+        Send a message and run until ``expected`` reaches the receiver, by
+        default the sender itself.
+        """
+        receiver = receiver or sender
+        start = len(receiver.received)
+        self.messages += 1
+        sender.send(message, via)
+        await self.run_until(lambda: expected in receiver.received[start:], timeout)
+
+    async def run_until(self, predicate: Callable[[], bool], timeout: float = 10.0):
+        """
+        Step the simulated clock until ``predicate()`` holds, or raise
+        ``asyncio.TimeoutError`` after ``timeout`` simulated seconds.
+        """
+        deadline = self.clock.now + timeout
+        while True:
+            await self._settle()
+            if predicate():
+                return
+            if not self.clock.step(deadline):
+                raise asyncio.TimeoutError(f"Condition not met within {timeout}s of simulated time")
+
+    async def _settle(self):
+        await asyncio.sleep(0)
+        if not self._server_busy():
+            return
+        real_deadline = time.monotonic() + self.task_timeout
+        while self._server_busy():
+            if time.monotonic() > real_deadline:
+                raise asyncio.TimeoutError("Server tasks did not finish")
+            await asyncio.sleep(0.001)
+        # Replies sent from tasks are only queued, so send them now rather
+        # than on the next timer.
+        for protocol in self.servers.values():
+            protocol.transmit()
+
+    def _server_busy(self) -> bool:
+        return any(
+            getattr(session, "tasks", None)
+            for protocol in self.servers.values()
+            for session in getattr(protocol, "_sessions", {}).values()
+        )
+
+    async def close(self, timeout: float = 10.0):
+        for client in self.clients:
+            client.close()
+        await self.run_until(lambda: not self.network.in_flight, timeout)
+
+    def report(self, setups: List[float]) -> Dict:
+        return {
+            "calls": len(setups),
+            "messages": self.messages,
+            "packets": self.network.sent,
+            "lost": self.network.lost,
+            "simulated_seconds": round(self.clock.now, 3),
+            "server_cpu_per_connect_ms": (
+                round(self.handshake_cpu / len(self.clients) * 1000, 3) if self.clients else None
+            ),
+            "server_cpu_per_message_us": (
+                round(self.server_cpu / self.messages * 1e6, 1) if self.messages else None
+            ),
+            "cpu_per_call_setup_ms": round(sum(setups) / len(setups) * 1000, 3) if setups else None,
+        }
+
+
+async def relay_calls(harness: LoopbackHarness, calls: int, via: str = "datagram") -> List[float]:
+    """
+    Run calls between two users through a relaying server such as main.py:
+    CALL and ANSWER for the setup, then BYE.
+
+    Returns the CPU time of each call setup.
+    """
+    caller = await harness.connect()
+    callee = await harness.connect()
+    await harness.exchange(caller, "REGISTER alice", expected="REGISTERED alice", via=via)
+    await harness.exchange(callee, "REGISTER bob", expected="REGISTERED bob", via=via)
+
+    setups = []
+    for _ in range(calls):
+        started = time.process_time()
+        await harness.exchange(caller, f"CALL bob|{SAMPLE_SDP}", callee, "CALL alice|", via)
+        await harness.exchange(callee, f"ANSWER alice|{SAMPLE_SDP}", caller, "ANSWER bob|", via)
+        setups.append(time.process_time() - started)
+        await harness.exchange(caller, "BYE bob", callee, "BYE alice", via)
+    return setups
+
+
+async def make_offer() -> str:
+    """
+    Create an audio SDP offer with host candidates only.
+    """
+    peer_connection = RTCPeerConnection(RTCConfiguration(iceServers=[]))
+    peer_connection.addTransceiver("audio")
+    await peer_connection.setLocalDescription(await peer_connection.createOffer())
+    sdp = peer_connection.localDescription.sdp
+    await peer_connection.close()
+    return sdp
+
+
+async def media_calls(harness: LoopbackHarness, calls: int, offer: Optional[str] = None) -> List[float]:
+    """
+    Run calls against a media server such as quic_telephony.protocol:
+    REGISTER and OFFER for the setup, then BYE.
+
+    Returns the CPU time of each call setup, which includes SDP negotiation.
+    """
+    offer = offer or await make_offer()
+    client = await harness.connect()
+
+    setups = []
+    for i in range(calls):
+        user_id = f"user-{i}"
+        started = time.process_time()
+        await harness.exchange(client, f"REGISTER {user_id}", expected=f"REGISTERED {user_id}")
+        await harness.exchange(client, f"OFFER {user_id}|{offer}", expected=f"ANSWER {user_id}|")
+        setups.append(time.process_time() - started)
+        await harness.exchange(client, f"BYE {user_id}", expected=f"CALL_ENDED {user_id}")
+    return setups
+
+
+# Server protocol used for each flow when --server is not given.
+DEFAULT_SERVERS = {
+    "relay": "main:WebTransportServerProtocol",
+    "media": "quic_telephony.protocol:WebTransportServerProtocol",
+}
+
+
+def load_protocol(spec: str) -> Callable[..., QuicConnectionProtocol]:
+    """
+    Import a server protocol class given as ``module:attribute``.
+    """
+    module_name, _, attribute = spec.partition(":")
+    return getattr(importlib.import_module(module_name), attribute or "WebTransportServerProtocol")
+
+
+async def run_benchmark(args) -> Dict:
+    create_protocol = load_protocol(args.server or DEFAULT_SERVERS[args.flow])
+    if args.flow == "media":
+        create_protocol = functools.partial(
+            create_protocol, ice_config=IceLiteConfig(args.ice_host or ["127.0.0.1"])
+        )
+    harness = LoopbackHarness(
+        create_protocol,
+        certificate=args.certificate,
+        private_key=args.private_key,
+        delay=args.delay,
+        jitter=args.jitter,
+        loss=args.loss,
+        reorder=args.reorder,
+        seed=args.seed,
+    )
+    if args.flow == "media":
+        setups = await media_calls(harness, args.calls)
+    else:
+        setups = await relay_calls(harness, args.calls, args.via)
+    await harness.close()
+    return harness.report(setups)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark a WebTransport server over an in-memory QUIC network.")
+    parser.add_argument(
+        "--server",
+        help="server protocol class as module:attribute (default: main.py for relay, "
+        "quic_telephony.protocol for media)",
+    )
+    parser.add_argument("--flow", choices=["relay", "media"], default="relay")
+    parser.add_argument("--via", choices=["datagram", "stream"], default="datagram")
+    parser.add_argument("--calls", type=int, default=100)
+    parser.add_argument("--delay", type=float, default=0.01, help="one-way delay in seconds")
+    parser.add_argument("--jitter", type=float, default=0.0, help="maximum extra delay in seconds")
+    parser.add_argument("--loss", type=float, default=0.0, help="fraction of datagrams dropped")
+    parser.add_argument("--reorder", type=float, default=0.0, help="fraction of datagrams held back")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--certificate", default="cert.pem")
+    parser.add_argument("--private-key", default="key.pem")
+    parser.add_argument("--ice-host", action="append", default=[], help="media host candidate address")
+    args = parser.parse_args()
+    if args.server is None:
+        args.server = DEFAULT_SERVERS[args.flow]
+    if args.flow == "media" and "ice_config" not in inspect.signature(load_protocol(args.server)).parameters:
+        parser.error(f"--flow media needs a server that takes ice_config, such as {DEFAULT_SERVERS['media']}")
+
+    # Keep the servers' per-message logging out of the measurements.
+    logging.disable(logging.INFO)
+    print(json.dumps(asyncio.run(run_benchmark(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
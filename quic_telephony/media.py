@@ -1,16 +1,19 @@
-from aiortc import RTCPeerConnection, RTCSessionDescription
+from aiortc import RTCSessionDescription
+from quic_telephony.ice import create_answer, create_peer_connection
 from quic_telephony.recorder import CallRecorder
 
 
 class MediaHandler:
-    def __init__(self, protocol):
+    def __init__(self, protocol, stats_collector=None, ice_config=None):
         self.protocol = protocol
+        self.stats_collector = stats_collector
+        self.ice_config = ice_config
         self.peer_connections = {}
         self.recorders = {}
 
     async def handle_offer(self, payload):
         user_id, sdp = payload.split("|", 1)
-        peer_connection = RTCPeerConnection()
+        peer_connection = create_peer_connection(self.ice_config)
         self.peer_connections[user_id] = peer_connection
 
         # Set up recording
@@ -23,14 +26,13 @@ class MediaHandler:
             await recorder.add_track(track)
 
         # Process the SDP offer
-        offer = RTCSessionDescription(sdp=sdp, type="offer")
-        await peer_connection.setRemoteDescription(offer)
-        answer = await peer_connection.createAnswer()
-        await peer_connection.setLocalDescription(answer)
+        answer_sdp = await create_answer(peer_connection, sdp, self.ice_config)
 
         # Start recording
         await recorder.start()
-        return f"ANSWER {user_id}|{peer_connection.localDescription.sdp}"
+        if self.stats_collector:
+            self.stats_collector.track(user_id, peer_connection)
+        return f"ANSWER {user_id}|{answer_sdp}"
 
     async def handle_answer(self, payload):
         user_id, sdp = payload.split("|", 1)
@@ -48,6 +50,8 @@ class MediaHandler:
         peer_connection = self.peer_connections.pop(user_id, None)
         recorder = self.recorders.pop(user_id, None)
 
+        if self.stats_collector:
+            self.stats_collector.untrack(user_id)
         if peer_connection:
             await peer_connection.close()
         if recorder:
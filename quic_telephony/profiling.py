@@ -0,0 +1,247 @@
+import asyncio
+import asyncio.events
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import weakref
+from collections import Counter
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# The profiler currently running, if any. Hooks in the signaling path check
+# this first, so they cost one global lookup while profiling is off.
+_active: Optional["Profiler"] = None
+
+
+def note_command(command: str, payload: str = ""):
+    """
+    Record the signaling command being processed by the current callback.
+
+    The label is only built while profiling, so the payload, which may hold
+    a whole SDP, is not copied otherwise.
+    """
+    if _active is not None:
+        _active.current_command = f"{command} {payload[:80].split('|', 1)[0]}"[:80]
+
+
+def label_task(task: asyncio.Task):
+    """
+    Attribute a task spawned while handling a command to that command.
+    """
+    if _active is not None and _active.current_command is not None:
+        _active.task_commands[task] = _active.current_command
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class Profiler:
+    """
+    Sampling profiler and slow-callback tracer for the event loop thread.
+
+    While running, a background thread samples the loop thread's stack every
+    ``interval`` seconds and ``asyncio.Handle._run`` is wrapped to time each
+    callback. Nothing is installed while the profiler is stopped.
+
+    Results are written to ``output_dir`` as a collapsed-stack file
+    (``*.folded``, the input format of ``flamegraph.pl`` and speedscope) and
+    a JSON lines file of callbacks slower than ``slow_callback_ms``.
+    """
+
+    def __init__(
+        self,
+        output_dir: str = ".",
+        interval: float = 0.005,
+        slow_callback_ms: float = 50.0,
+        max_duration: float = 300.0,
+    ):
+        self.output_dir = output_dir
+        self.interval = interval
+        self.slow_callback_ms = slow_callback_ms
+        self.max_duration = max_duration
+
+        self.current_command: Optional[str] = None
+        self.task_commands: "weakref.WeakKeyDictionary[asyncio.Task, str]" = weakref.WeakKeyDictionary()
+        self.slow_callbacks: List[Dict] = []
+        self._original_run = None
+        self._stop_event: Optional[threading.Event] = None
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._prefix: Optional[str] = None
+
+    @property
+    def active(self) -> bool:
+        return _active is self
+
+    def start(self, duration: float, slow_callback_ms: Optional[float] = None) -> str:
+        """
+        Start profiling for at most ``duration`` seconds.
+
+        Must be called from the event loop thread.
+        """
+        global _active
+        if _active is not None:
+            raise RuntimeError("A profiling session is already running")
+
+        duration = min(duration, self.max_duration)
+        if slow_callback_ms is not None:
+            self.slow_callback_ms = slow_callback_ms
+        self._prefix = os.path.join(self.output_dir, time.strftime("profile-%Y%m%d-%H%M%S"))
+        self.current_command = None
+        self.task_commands = weakref.WeakKeyDictionary()
+        self.slow_callbacks = []
+
+        self._install_callback_timer()
+        self._stop_event = threading.Event()
+        threading.Thread(
+            target=self._sample,
+            args=(threading.get_ident(), self._stop_event, self._prefix, self.slow_callbacks),
+            name="quic-telephony-profiler",
+            daemon=True,
+        ).start()
+        self._timer = asyncio.get_event_loop().call_later(duration, self.stop)
+        _active = self
+
+        logger.info(f"Profiling started for {duration:.0f}s, writing {self._prefix}.*")
+        return self._prefix
+
+    def stop(self) -> Optional[str]:
+        """
+        Stop profiling and hand the results to the sampler thread for writing.
+        """
+        global _active
+        if _active is not self:
+            return None
+        _active = None
+
+        asyncio.events.Handle._run = self._original_run
+        self._original_run = None
+        if self._timer:
+            self._timer.cancel()
+            self._timer = None
+
+        # The sampler thread writes both files after it sees the stop event.
+        self._stop_event.set()
+        logger.info(f"Profiling stopped, {len(self.slow_callbacks)} slow callbacks")
+        return self._prefix
+
+    def status(self) -> Dict:
+        return {
+            "active": self.active,
+            "output": self._prefix,
+            "slow_callbacks": len(self.slow_callbacks),
+            "slow_callback_ms": self.slow_callback_ms,
+        }
+
+    def _install_callback_timer(self):
+        original_run = self._original_run = asyncio.events.Handle._run
+        profiler = self
+        perf_counter = time.perf_counter
+
+        def _run(handle):
+            profiler.current_command = None
+            started = perf_counter()
+            original_run(handle)
+            elapsed_ms = (perf_counter() - started) * 1000
+            if elapsed_ms > profiler.slow_callback_ms:
+                profiler.record_slow_callback(handle, elapsed_ms)
+
+        asyncio.events.Handle._run = _run
+
+    def record_slow_callback(self, handle, elapsed_ms: float):
+        callback = handle._callback
+        owner = getattr(callback, "__self__", None)
+        command = self.current_command
+        if command is None and isinstance(owner, asyncio.Task):
+            command = self.task_commands.get(owner)
+        self.slow_callbacks.append(
+            {
+                "time": time.time(),
+                "duration_ms": round(elapsed_ms, 3),
+                "callback": repr(owner if isinstance(owner, asyncio.Task) else callback)[:200],
+                "command": command,
+            }
+        )
+
+    def _sample(self, thread_id: int, stop_event: threading.Event, prefix: str, slow_callbacks: List[Dict]):
+        stacks: Counter = Counter()
+        while not stop_event.wait(self.interval):
+            frame = sys._current_frames().get(thread_id)
+            labels = []
+            while frame is not None:
+                labels.append(_frame_label(frame))
+                frame = frame.f_back
+            if labels:
+                stacks[";".join(reversed(labels))] += 1
+
+        with open(f"{prefix}.folded", "w") as fp:
+            for stack, count in stacks.most_common():
+                fp.write(f"{stack} {count}\n")
+        with open(f"{prefix}.slow.jsonl", "w") as fp:
+            for record in slow_callbacks:
+                fp.write(json.dumps(record) + "\n")
+
+
+class ProfilerControlServer:
+    """
+    Admin control for a ``Profiler`` over a local Unix socket.
+
+    The socket is created with mode 0600, so only the user running the node
+    can reach it. Each connection sends one line and gets one line back:
+
+    - ``start [seconds] [slow_ms]``
+    - ``stop``
+    - ``status``
+    """
+
+    def __init__(self, profiler: Profiler, path: str):
+        self.profiler = profiler
+        self.path = path
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    async def start(self):
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        old_umask = os.umask(0o177)
+        try:
+            self._server = await asyncio.start_unix_server(self.handle_client, path=self.path)
+        finally:
+            os.umask(old_umask)
+        logger.info(f"Profiler control socket listening on {self.path}")
+
+    async def stop(self):
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            line = await asyncio.wait_for(reader.readline(), timeout=5.0)
+            writer.write((self.handle_command(line.decode().strip()) + "\n").encode())
+            await writer.drain()
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            writer.close()
+
+    def handle_command(self, line: str) -> str:
+        command, *args = line.split() or [""]
+        try:
+            if command == "start":
+                duration = float(args[0]) if args else 30.0
+                slow_ms = float(args[1]) if len(args) > 1 else None
+                return f"STARTED {self.profiler.start(duration, slow_ms)}"
+            elif command == "stop":
+                prefix = self.profiler.stop()
+                return f"STOPPED {prefix}" if prefix else "ERROR Not running"
+            elif command == "status":
+                return f"STATUS {json.dumps(self.profiler.status())}"
+        except (RuntimeError, ValueError) as e:
+            return f"ERROR {e}"
+        return "ERROR Unknown command"
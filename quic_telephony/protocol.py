@@ -1,6 +1,10 @@
+import argparse
+import functools
+import importlib
 import logging
 from typing import Dict, Optional
 
+from aioquic.asyncio import serve
 from aioquic.asyncio.protocol import QuicConnectionProtocol
 from aioquic.h3.connection import H3Connection
 from aioquic.h3.events import (
@@ -11,9 +15,16 @@ from aioquic.h3.events import (
 )
 from collections import deque
 import asyncio
-from aioquic.quic.events import ProtocolNegotiated, QuicEvent
-from typing import Deque, Dict, Optional
+from aioquic.quic.configuration import QuicConfiguration
+from aioquic.quic.events import ConnectionTerminated, ProtocolNegotiated, QuicEvent
+from typing import Deque, Dict, List, Optional, Tuple
+from quic_telephony.admission import AdmissionController
+from quic_telephony.cdr import CdrRecorder, open_cdr_sink
+from quic_telephony.profiling import Profiler, ProfilerControlServer
+from quic_telephony.ice import IceLiteConfig
+from quic_telephony.asgi import AsgiApplication, AsgiWebTransportSession
 from quic_telephony.sessions import WebTransportHandler
+from quic_telephony.stats import StatsCollector
 
 logger = logging.getLogger(__name__)
 
@@ -21,14 +32,45 @@ logger = logging.getLogger(__name__)
 class WebTransportServerProtocol(QuicConnectionProtocol):
     """
     HTTP/3 server protocol with WebTransport support.
+
+    When ``app`` is given, WebTransport sessions are handed to that ASGI
+    application instead of the built-in signaling handler. Incoming
+    datagrams and stream data are put on ``queue`` and a pump task drains
+    it in batches of up to ``batch_size`` messages. When the connection is
+    terminated, sessions get a ``webtransport.close`` message and are
+    cancelled if still running after ``close_grace`` seconds.
     """
 
-    def __init__(self, *args, **kwargs):
+    def __init__(
+        self,
+        *args,
+        stats_collector: Optional[StatsCollector] = None,
+        admission: Optional[AdmissionController] = None,
+        ice_config: Optional[IceLiteConfig] = None,
+        cdr: Optional[CdrRecorder] = None,
+        app: Optional[AsgiApplication] = None,
+        batch_size: int = 64,
+        close_grace: float = 1.0,
+        **kwargs,
+    ):
         super().__init__(*args, **kwargs)
+        self.stats_collector = stats_collector
+        self.admission = admission
+        self.ice_config = ice_config
+        self.cdr = cdr
+        self.app = app
+        self.batch_size = batch_size
+        self.close_grace = close_grace
+        self.terminated = False
         self._http: Optional[H3Connection] = None
         self._sessions: Dict[int, WebTransportHandler] = {}
+        self._asgi_sessions: Dict[int, AsgiWebTransportSession] = {}
         self.http_event_queue: Deque[H3Event] = deque()
         self.queue: asyncio.Queue[Dict] = asyncio.Queue()
+        self._drain_waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._pump_task: Optional[asyncio.Task] = None
+        if app is not None:
+            self._pump_task = asyncio.ensure_future(self.pump())
 
     def quic_event_received(self, event: QuicEvent):
         """
@@ -36,14 +78,8 @@ class WebTransportServerProtocol(QuicConnectionProtocol):
         """
         if isinstance(event, ProtocolNegotiated):
             self._http = H3Connection(self._quic, enable_webtransport=True)
-        if isinstance(event, WebTransportStreamDataReceived):
-                    self.queue.put_nowait(
-                        {
-                            "data": event.data,
-                            "stream": event.stream_id,
-                            "type": "webtransport.stream.receive",
-                        }
-                    )
+        elif isinstance(event, ConnectionTerminated):
+            self.connection_terminated()
 
         # Pass event to HTTP/3 layer
         if self._http:
@@ -57,15 +93,29 @@ class WebTransportServerProtocol(QuicConnectionProtocol):
         if isinstance(event, HeadersReceived):
             self.handle_headers(event)
         elif isinstance(event, DatagramReceived):
-            self.queue.put_nowait(
-                        {
-                            "data": event.data,
-                            "type": "webtransport.datagram.receive",
-                        }
-                    )
-            self.handle_datagram(event)
+            if event.stream_id in self._asgi_sessions:
+                self.queue.put_nowait(
+                    {
+                        "data": event.data,
+                        "session": event.stream_id,
+                        "type": "webtransport.datagram.receive",
+                    }
+                )
+            else:
+                self.handle_datagram(event)
         elif isinstance(event, WebTransportStreamDataReceived):
-            self.handle_stream_data(event)
+            if event.session_id in self._asgi_sessions:
+                self.queue.put_nowait(
+                    {
+                        "data": event.data,
+                        "end_stream": event.stream_ended,
+                        "session": event.session_id,
+                        "stream": event.stream_id,
+                        "type": "webtransport.stream.receive",
+                    }
+                )
+            else:
+                self.handle_stream_data(event)
 
     def handle_headers(self, event: HeadersReceived):
         """
@@ -73,7 +123,17 @@ class WebTransportServerProtocol(QuicConnectionProtocol):
         """
         headers = {k.decode(): v.decode() for k, v in event.headers}
         if headers.get(":method") == "CONNECT" and headers.get(":protocol") == "webtransport":
-            handler = WebTransportHandler(connection=self._http, stream_id=event.stream_id)
+            if self.app is not None:
+                self.start_asgi_session(event, headers)
+                return
+            handler = WebTransportHandler(
+                connection=self._http,
+                stream_id=event.stream_id,
+                stats_collector=self.stats_collector,
+                admission=self.admission,
+                ice_config=self.ice_config,
+                cdr=self.cdr,
+            )
             handler.accept_session()
             self._sessions[event.stream_id] = handler
         else:
@@ -96,3 +156,195 @@ class WebTransportServerProtocol(QuicConnectionProtocol):
         handler = self._sessions.get(event.session_id)
         if handler:
             handler.http_event_received(event)
+
+    def start_asgi_session(self, event: HeadersReceived, headers: Dict[str, str]):
+        """
+        Start one ASGI application task for a new WebTransport session.
+        """
+        path, _, query_string = headers.get(":path", "/").partition("?")
+        scope = {
+            "type": "webtransport",
+            "asgi": {"version": "3.0"},
+            "http_version": "3",
+            "scheme": headers.get(":scheme", "https"),
+            "path": path,
+            "raw_path": path.encode(),
+            "query_string": query_string.encode(),
+            "headers": [(k, v) for k, v in event.headers if not k.startswith(b":")],
+        }
+        self._asgi_sessions[event.stream_id] = AsgiWebTransportSession(
+            protocol=self, stream_id=event.stream_id, scope=scope, app=self.app
+        )
+
+    def session_finished(self, stream_id: int):
+        """
+        Forget an ASGI session once its application task has returned.
+        """
+        self._asgi_sessions.pop(stream_id, None)
+
+    async def pump(self):
+        """
+        Drain ``queue`` in batches and route messages to their sessions.
+
+        Every message already queued is dispatched in one pass, so a burst
+        of packets wakes each application task once rather than once per
+        message.
+        """
+        while True:
+            batch: List[Dict] = [await self.queue.get()]
+            while len(batch) < self.batch_size and not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+
+            for message in batch:
+                session = self._asgi_sessions.get(message.pop("session"))
+                if session is not None:
+                    session.queue.put_nowait(message)
+
+    def stream_buffered(self, stream_id: int) -> int:
+        """
+        Return how many bytes of a stream aioquic holds until they are
+        acknowledged.
+        """
+        stream = self._quic._streams.get(stream_id)
+        if stream is None:
+            return 0
+        return stream.sender._buffer_stop - stream.sender._buffer_start
+
+    async def wait_stream_drained(self, stream_id: int, limit: int):
+        """
+        Wait until at most ``limit`` bytes of a stream are buffered, or the
+        connection is terminated.
+        """
+        if self.terminated or self.stream_buffered(stream_id) <= limit:
+            return
+        waiter = self._loop.create_future()
+        self._drain_waiters.append((stream_id, limit, waiter))
+        await waiter
+
+    def wake_drain_waiters(self, everyone: bool = False):
+        waiting = []
+        for stream_id, limit, waiter in self._drain_waiters:
+            if waiter.done():
+                continue
+            if everyone or self.stream_buffered(stream_id) <= limit:
+                waiter.set_result(None)
+            else:
+                waiting.append((stream_id, limit, waiter))
+        self._drain_waiters = waiting
+
+    def transmit(self):
+        # Acknowledgements are processed just before a transmit, so this is
+        # where buffered stream data can have been released.
+        super().transmit()
+        if self._drain_waiters:
+            self.wake_drain_waiters()
+
+    def connection_terminated(self):
+        """
+        Tell ASGI sessions the connection is gone and stop the pump.
+        """
+        self.terminated = True
+        self.wake_drain_waiters(everyone=True)
+        for session in list(self._asgi_sessions.values()):
+            session.queue.put_nowait({"type": "webtransport.close"})
+        if self._pump_task is not None:
+            self._pump_task.cancel()
+            self._pump_task = None
+        if self._asgi_sessions:
+            self._loop.call_later(self.close_grace, self.cancel_asgi_sessions)
+
+    def cancel_asgi_sessions(self):
+        """
+        Cancel ASGI sessions that did not return after ``webtransport.close``.
+        """
+        for session in list(self._asgi_sessions.values()):
+            session.task.cancel()
+
+
+def load_app(spec: str) -> AsgiApplication:
+    """
+    Import an ASGI application given as ``module:attribute``.
+    """
+    module_name, _, attribute = spec.partition(":")
+    return getattr(importlib.import_module(module_name), attribute or "app")
+
+
+async def run_server(
+    host: str,
+    port: int,
+    certificate: str,
+    private_key: str,
+    app: Optional[AsgiApplication],
+    admin_socket: Optional[str] = None,
+    ice_config: Optional[IceLiteConfig] = None,
+    cdr_target: Optional[str] = None,
+):
+    """
+    Serve WebTransport until cancelled.
+    """
+    configuration = QuicConfiguration(
+        is_client=False, alpn_protocols=["h3"], max_datagram_frame_size=65536
+    )
+    configuration.load_cert_chain(certfile=certificate, keyfile=private_key)
+
+    stats_collector = StatsCollector()
+    stats_collector.start()
+    admission = AdmissionController()
+    admission.start()
+    cdr = CdrRecorder(open_cdr_sink(cdr_target)) if cdr_target else None
+    if cdr:
+        cdr.start()
+    if admin_socket:
+        await ProfilerControlServer(Profiler(), admin_socket).start()
+    await serve(
+        host,
+        port,
+        configuration=configuration,
+        create_protocol=functools.partial(
+            WebTransportServerProtocol,
+            stats_collector=stats_collector,
+            admission=admission,
+            ice_config=ice_config,
+            cdr=cdr,
+            app=app,
+        ),
+    )
+    try:
+        await asyncio.Future()  # Run indefinitely
+    finally:
+        if cdr:
+            await cdr.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="QUIC telephony WebTransport server.")
+    parser.add_argument("app", nargs="?", help="ASGI WebTransport application, e.g. demo:app")
+    parser.add_argument("--host", default="::")
+    parser.add_argument("--port", type=int, default=4433)
+    parser.add_argument("--certificate", default="cert.pem")
+    parser.add_argument("--private-key", default="key.pem")
+    parser.add_argument("--admin-socket", help="Unix socket path for profiler control")
+    parser.add_argument(
+        "--ice-host",
+        action="append",
+        default=[],
+        help="local address for media host candidates, enables the ICE-lite fast path",
+    )
+    parser.add_argument("--ice-advertise", help="public address to advertise in host candidates")
+    parser.add_argument(
+        "--cdr", help="write call detail records to an SQLite file (*.db) or a directory of JSON lines files"
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    app = load_app(args.app) if args.app else None
+    ice_config = IceLiteConfig(args.ice_host, args.ice_advertise) if args.ice_host else None
+    asyncio.run(
+        run_server(
+            args.host, args.port, args.certificate, args.private_key, app, args.admin_socket, ice_config, args.cdr
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
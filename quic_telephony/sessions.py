@@ -1,8 +1,13 @@
 import logging
-from typing import Dict
+from typing import Dict, Optional, Set
 import asyncio
 from aioquic.h3.connection import H3Connection
 from aioquic.h3.events import DatagramReceived
+from quic_telephony.admission import AdmissionController
+from quic_telephony.cdr import CdrRecorder
+from quic_telephony.ice import IceLiteConfig
+from quic_telephony.profiling import label_task, note_command
+from quic_telephony.stats import StatsCollector, stats_reply
 from quic_telephony.webrtc import WebRTCConnection
 
 logger = logging.getLogger(__name__)
@@ -13,9 +18,22 @@ class WebTransportHandler:
     Handles WebTransport sessions, including datagrams and streams.
     """
 
-    def __init__(self, connection: H3Connection, stream_id: int):
+    def __init__(
+        self,
+        connection: H3Connection,
+        stream_id: int,
+        stats_collector: Optional[StatsCollector] = None,
+        admission: Optional[AdmissionController] = None,
+        ice_config: Optional[IceLiteConfig] = None,
+        cdr: Optional[CdrRecorder] = None,
+    ):
         self.connection = connection
         self.stream_id = stream_id
+        self.stats_collector = stats_collector
+        self.admission = admission
+        self.ice_config = ice_config
+        self.cdr = cdr
+        self.tasks: Set[asyncio.Task] = set()
         self.accepted = False
         self.closed = False
         self.users: Dict[str, WebRTCConnection] = {}
@@ -45,34 +63,79 @@ class WebTransportHandler:
         """
         Handle WebTransport datagrams for signaling commands.
         """
+        # Rate-limited datagrams are dropped before any parsing work.
+        if self.admission and not self.admission.allow_connection(self.connection):
+            return
+
         message = data.decode()
         logger.info(f"Received Datagram: {message}")
 
         command, *payload = message.split(" ", 1)
         payload = payload[0] if payload else ""
+        note_command(command, payload)
+
+        # BYE frees resources, so it is never limited or shed. Only users
+        # this session owns or is registering are charged, and user buckets
+        # are per connection, so a client cannot drain the bucket of a user
+        # registered elsewhere, even by registering the same id.
+        if self.admission and command != "BYE":
+            user_id = payload.split("|", 1)[0].strip()
+            owned = user_id in self.users or (command == "REGISTER" and user_id != "")
+            if owned and not self.admission.allow_user(self.connection, user_id):
+                self.send_datagram(f"BUSY {command} {user_id}")
+                return
 
         if command == "REGISTER":
+            if self.admission and not self.admission.admit():
+                self.send_datagram("BUSY REGISTER")
+                return
             user_id = payload.strip()
-            self.users[user_id] = WebRTCConnection(user_id=user_id)
+            self.users[user_id] = WebRTCConnection(
+                user_id=user_id, stats_collector=self.stats_collector, ice_config=self.ice_config
+            )
+            if self.cdr:
+                self.cdr.register(user_id)
             self.send_datagram(f"REGISTERED {user_id}")
         elif command == "OFFER":
             user_id, sdp = payload.split("|", 1)
             webrtc_connection = self.users.get(user_id)
-            if webrtc_connection:
-                asyncio.create_task(self.process_offer(webrtc_connection, user_id, sdp))
-            else:
+            if not webrtc_connection:
                 self.send_datagram(f"ERROR User {user_id} not found")
+            elif self.admission and not self.admission.reserve_offer():
+                self.send_datagram(f"BUSY OFFER {user_id}")
+            else:
+                if self.cdr:
+                    self.cdr.call_start(user_id)
+                self.spawn(self.process_offer(webrtc_connection, user_id, sdp))
         elif command == "BYE":
             user_id = payload.strip()
-            asyncio.create_task(self.close_connection(user_id))
+            self.spawn(self.close_connection(user_id))
+        elif command == "STATS":
+            self.send_datagram(stats_reply(self.stats_collector, payload.strip()))
         else:
             self.send_datagram("ERROR Unknown command")
 
+    def spawn(self, coro) -> asyncio.Task:
+        """
+        Run a coroutine in a task that is tracked until it finishes.
+        """
+        task = asyncio.ensure_future(coro)
+        self.tasks.add(task)
+        label_task(task)
+        task.add_done_callback(self.tasks.discard)
+        return task
+
     async def process_offer(self, webrtc_connection: WebRTCConnection, user_id: str, sdp: str):
         """
         Process the SDP offer and send the SDP answer.
         """
-        answer_sdp = await webrtc_connection.handle_offer(sdp)
+        if self.admission:
+            async with self.admission.offer_slot():
+                answer_sdp = await webrtc_connection.handle_offer(sdp)
+        else:
+            answer_sdp = await webrtc_connection.handle_offer(sdp)
+        if self.cdr:
+            self.cdr.answer(user_id)
         self.send_datagram(f"ANSWER {user_id}|{answer_sdp}")
 
     async def close_connection(self, user_id: str):
@@ -81,6 +144,10 @@ class WebTransportHandler:
         """
         webrtc_connection = self.users.pop(user_id, None)
         if webrtc_connection:
+            if self.cdr:
+                # Closing untracks the connection, so take its stats first.
+                stats = self.stats_collector.summary(user_id) if self.stats_collector else None
+                self.cdr.bye(user_id, stats=stats)
             await webrtc_connection.close()
             self.send_datagram(f"CALL_ENDED {user_id}")
         else:
@@ -90,4 +157,4 @@ class WebTransportHandler:
         """
         Send a WebTransport datagram to the client.
         """
-        self.connection.send_datagram(data=message.encode())
+        self.connection.send_datagram(stream_id=self.stream_id, data=message.encode())
@@ -1,5 +1,6 @@
 from quic_telephony.sessions import SessionManager
 from quic_telephony.media import MediaHandler
+from quic_telephony.stats import stats_reply
 
 
 class SignalingHandler:
@@ -10,6 +11,7 @@ class SignalingHandler:
             "OFFER": self.handle_offer,
             "ANSWER": self.handle_answer,
             "BYE": self.handle_bye,
+            "STATS": self.handle_stats,
         }
 
     async def handle_command(self, command, payload):
@@ -34,3 +36,6 @@ class SignalingHandler:
 
     async def handle_bye(self, payload):
         return await self.protocol.media_handler.handle_bye(payload)
+
+    async def handle_stats(self, payload):
+        return stats_reply(self.protocol.media_handler.stats_collector, payload.strip())
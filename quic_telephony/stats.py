@@ -0,0 +1,285 @@
+import asyncio
+import json
+import logging
+import random
+import time
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple
+
+from aiortc import RTCPeerConnection
+from aiortc.sdp import SessionDescription
+
+logger = logging.getLogger(__name__)
+
+METRICS = ("packet_loss", "jitter_ms", "rtt_ms", "bitrate_kbps")
+
+# RTP clock rates assumed when the negotiated codec is not known yet.
+DEFAULT_CLOCK_RATES = {"audio": 48000, "video": 90000}
+
+
+def clock_rates(peer_connection: RTCPeerConnection) -> Dict[str, int]:
+    """
+    Return the RTP clock rate of the negotiated codec for each media kind,
+    taken from the local description once it is set.
+    """
+    description = peer_connection.localDescription
+    if description is None:
+        return {}
+    rates: Dict[str, int] = {}
+    for media in SessionDescription.parse(description.sdp).media:
+        if media.rtp.codecs:
+            rates.setdefault(media.kind, media.rtp.codecs[0].clockRate)
+    return rates
+
+
+class CallQualityWindow:
+    """
+    Rolling window of media quality samples for a single call.
+
+    Each sample is one ``(timestamp, packet_loss, jitter_ms, rtt_ms,
+    bitrate_kbps)`` tuple. Counters reported by ``getStats()`` are cumulative,
+    so the previous totals are kept to turn them into per-interval deltas.
+    Jitter is reported in RTP timestamp units and is converted to
+    milliseconds with the clock rate of the stream's codec.
+    """
+
+    __slots__ = ("samples", "_lost", "_received", "_bytes", "_timestamp")
+
+    def __init__(self, size: int = 30):
+        self.samples: Deque[Tuple[float, ...]] = deque(maxlen=size)
+        self._lost = 0
+        self._received = 0
+        self._bytes = 0
+        self._timestamp: Optional[float] = None
+
+    def add_report(self, report, now: float, rates: Optional[Dict[str, int]] = None):
+        """
+        Fold an ``RTCStatsReport`` into the window. ``rates`` maps a media
+        kind to its RTP clock rate.
+        """
+        lost = received = total_bytes = 0
+        jitter_ms = 0.0
+        rtts: List[float] = []
+        for stats in report.values():
+            if stats.type == "inbound-rtp":
+                lost += stats.packetsLost
+                received += stats.packetsReceived
+                rate = (rates or {}).get(stats.kind) or DEFAULT_CLOCK_RATES.get(stats.kind, 90000)
+                jitter_ms = max(jitter_ms, stats.jitter / rate * 1000.0)
+            elif stats.type == "remote-inbound-rtp":
+                # Unset until the remote side has seen a sender report.
+                if stats.roundTripTime is not None:
+                    rtts.append(stats.roundTripTime * 1000.0)
+            elif stats.type == "transport":
+                total_bytes += stats.bytesSent + stats.bytesReceived
+
+        if self._timestamp is not None:
+            delta_lost = max(lost - self._lost, 0)
+            delta_received = max(received - self._received, 0)
+            expected = delta_lost + delta_received
+            elapsed = max(now - self._timestamp, 1e-6)
+            self.samples.append(
+                (
+                    now,
+                    delta_lost / expected if expected else 0.0,
+                    jitter_ms,
+                    sum(rtts) / len(rtts) if rtts else 0.0,
+                    max(total_bytes - self._bytes, 0) * 8 / elapsed / 1000.0,
+                )
+            )
+
+        self._lost = lost
+        self._received = received
+        self._bytes = total_bytes
+        self._timestamp = now
+
+    def summary(self) -> Dict:
+        """
+        Summarise the window as average, maximum and latest value per metric.
+        """
+        result: Dict = {"samples": len(self.samples)}
+        if not self.samples:
+            return result
+        for index, name in enumerate(METRICS, start=1):
+            values = [sample[index] for sample in self.samples]
+            result[name] = {
+                "avg": round(sum(values) / len(values), 3),
+                "max": round(max(values), 3),
+                "last": round(values[-1], 3),
+            }
+        result["updated"] = self.samples[-1][0]
+        return result
+
+
+class StatsCollector:
+    """
+    Periodically polls ``RTCPeerConnection.getStats()`` for tracked calls.
+
+    Every ``interval`` seconds each call is polled once. Calls are split into
+    batches of ``batch_size`` and the batches are spread evenly across the
+    interval, so the polling load stays flat no matter how many calls are
+    active.
+    """
+
+    def __init__(self, interval: float = 5.0, batch_size: int = 50, window: int = 30):
+        self.interval = interval
+        self.batch_size = batch_size
+        self.window = window
+        self._connections: Dict[str, RTCPeerConnection] = {}
+        self._windows: Dict[str, CallQualityWindow] = {}
+        self._rates: Dict[str, Dict[str, int]] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def track(self, call_id: str, peer_connection: RTCPeerConnection):
+        """
+        Start collecting statistics for a call.
+        """
+        self._connections[call_id] = peer_connection
+        self._windows.setdefault(call_id, CallQualityWindow(self.window))
+
+    def untrack(self, call_id: str):
+        """
+        Stop collecting statistics for a call and drop its window.
+        """
+        self._connections.pop(call_id, None)
+        self._windows.pop(call_id, None)
+        self._rates.pop(call_id, None)
+
+    def start(self):
+        """
+        Start the background polling task.
+        """
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        """
+        Stop the background polling task.
+        """
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        # Random initial offset so co-located nodes do not poll in lockstep.
+        await asyncio.sleep(random.uniform(0, self.interval))
+        while True:
+            started = time.monotonic()
+            call_ids = list(self._connections)
+            batches = [
+                call_ids[i:i + self.batch_size]
+                for i in range(0, len(call_ids), self.batch_size)
+            ]
+            spacing = self.interval / max(len(batches), 1)
+            for batch in batches:
+                try:
+                    await self.poll(batch)
+                except Exception:
+                    # A failing batch must not stop collection for every call.
+                    logger.exception(f"Failed to poll {len(batch)} calls")
+                await asyncio.sleep(spacing)
+            if not batches:
+                await asyncio.sleep(self.interval)
+            logger.debug(
+                f"Polled {len(call_ids)} calls in {time.monotonic() - started:.2f}s"
+            )
+
+    async def poll(self, call_ids: List[str]):
+        """
+        Poll one batch of calls and fold the reports into their windows.
+        """
+        pending = []
+        for call_id in call_ids:
+            peer_connection = self._connections.get(call_id)
+            if peer_connection is None:
+                continue
+            if peer_connection.connectionState == "closed":
+                self.untrack(call_id)
+                continue
+            pending.append((call_id, peer_connection))
+
+        reports = await asyncio.gather(
+            *(peer_connection.getStats() for _, peer_connection in pending),
+            return_exceptions=True,
+        )
+        now = time.time()
+        for (call_id, peer_connection), report in zip(pending, reports):
+            window = self._windows.get(call_id)
+            if isinstance(report, Exception):
+                logger.warning(f"getStats failed for call {call_id}: {report}")
+            elif window is not None:
+                try:
+                    if call_id not in self._rates:
+                        rates = clock_rates(peer_connection)
+                        if rates:
+                            self._rates[call_id] = rates
+                    window.add_report(report, now, self._rates.get(call_id))
+                except Exception:
+                    logger.exception(f"Failed to fold stats for call {call_id}")
+
+    def summary(self, call_id: str) -> Optional[Dict]:
+        """
+        Return the quality summary for a single call.
+        """
+        window = self._windows.get(call_id)
+        return window.summary() if window else None
+
+    def snapshot(self) -> Dict[str, Dict]:
+        """
+        Return the quality summaries for all tracked calls.
+        """
+        return {call_id: window.summary() for call_id, window in self._windows.items()}
+
+    def aggregate(self) -> Dict:
+        """
+        Return node-wide figures: the mean of the per-call averages and the
+        worst value seen for each metric.
+        """
+        summaries = [summary for summary in self.snapshot().values() if summary["samples"]]
+        result: Dict = {"calls": len(self._windows), "reporting": len(summaries)}
+        for name in METRICS:
+            if summaries:
+                result[name] = {
+                    "avg": round(sum(s[name]["avg"] for s in summaries) / len(summaries), 3),
+                    "max": max(s[name]["max"] for s in summaries),
+                }
+        return result
+
+    async def export(self, path: str):
+        """
+        Append the current summaries to ``path`` as newline-delimited JSON.
+
+        The write runs in the default executor so the event loop never blocks
+        on disk I/O.
+        """
+        lines = [
+            json.dumps({"call_id": call_id, **summary}, separators=(",", ":"))
+            for call_id, summary in self.snapshot().items()
+        ]
+        if not lines:
+            return
+
+        def write():
+            with open(path, "a") as fp:
+                fp.write("\n".join(lines) + "\n")
+
+        await asyncio.get_event_loop().run_in_executor(None, write)
+
+
+def stats_reply(collector: Optional[StatsCollector], user_id: str) -> str:
+    """
+    Build the signaling reply to a ``STATS`` command for one user, or for the
+    whole node when no user is given.
+    """
+    if not collector:
+        return "ERROR Stats collection disabled"
+    if not user_id:
+        return f"STATS |{json.dumps(collector.aggregate(), separators=(',', ':'))}"
+    summary = collector.summary(user_id)
+    if summary is None:
+        return f"ERROR User {user_id} not found"
+    return f"STATS {user_id}|{json.dumps(summary, separators=(',', ':'))}"
@@ -1,6 +1,8 @@
 import logging
-from aiortc import RTCPeerConnection, RTCSessionDescription
+from typing import Optional
 from aiortc.contrib.media import MediaRecorder
+from quic_telephony.ice import IceLiteConfig, create_answer, create_peer_connection
+from quic_telephony.stats import StatsCollector
 
 logger = logging.getLogger(__name__)
 
@@ -10,9 +12,16 @@ class WebRTCConnection:
     Manages a WebRTC connection for a user.
     """
 
-    def __init__(self, user_id: str):
+    def __init__(
+        self,
+        user_id: str,
+        stats_collector: Optional[StatsCollector] = None,
+        ice_config: Optional[IceLiteConfig] = None,
+    ):
         self.user_id = user_id
-        self.peer_connection = RTCPeerConnection()
+        self.stats_collector = stats_collector
+        self.ice_config = ice_config
+        self.peer_connection = create_peer_connection(ice_config)
         self.recorder = MediaRecorder(f"call_{user_id}.mp4")
 
         @self.peer_connection.on("track")
@@ -25,19 +34,21 @@ class WebRTCConnection:
         Process SDP offer and generate an SDP answer.
         """
         logger.info(f"Processing SDP offer for user {self.user_id}")
-        offer = RTCSessionDescription(sdp=sdp, type="offer")
-        await self.peer_connection.setRemoteDescription(offer)
-        answer = await self.peer_connection.createAnswer()
-        await self.peer_connection.setLocalDescription(answer)
+        answer_sdp = await create_answer(self.peer_connection, sdp, self.ice_config)
 
         # Start recording
         await self.recorder.start()
 
-        return self.peer_connection.localDescription.sdp
+        if self.stats_collector:
+            self.stats_collector.track(self.user_id, self.peer_connection)
+
+        return answer_sdp
 
     async def close(self):
         """
         Close the WebRTC connection and stop recording.
         """
+        if self.stats_collector:
+            self.stats_collector.untrack(self.user_id)
         await self.peer_connection.close()
         await self.recorder.stop()
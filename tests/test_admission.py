@@ -0,0 +1,61 @@
+import pytest
+from quic_telephony.admission import AdmissionController, TokenBucket
+from quic_telephony.sessions import WebTransportHandler
+
+
+def test_token_bucket_refills():
+    bucket = TokenBucket(rate=1.0, burst=2)
+    now = bucket.updated
+    assert bucket.allow(now)
+    assert bucket.allow(now)
+    assert not bucket.allow(now)
+    assert bucket.allow(now + 1.0)
+
+
+@pytest.mark.asyncio
+async def test_offers_are_shed_when_queue_is_full():
+    admission = AdmissionController(max_inflight_offers=1, max_queued_offers=1)
+    assert admission.reserve_offer()
+    assert admission.reserve_offer()
+    assert not admission.reserve_offer()
+    assert admission.shed == 1
+
+    async with admission.offer_slot():
+        pass
+    assert admission.pending_offers == 1
+    assert admission.reserve_offer()
+
+
+class RecordingConnection:
+    def __init__(self):
+        self.datagrams = []
+
+    def send_datagram(self, stream_id, data):
+        self.datagrams.append(data.decode())
+
+
+def test_sessions_cannot_drain_other_users_buckets():
+    admission = AdmissionController(connection_rate=0, connection_burst=1000, user_rate=0, user_burst=3)
+    attacker = WebTransportHandler(RecordingConnection(), 0, admission=admission)
+    victim = WebTransportHandler(RecordingConnection(), 0, admission=admission)
+    for _ in range(24):
+        attacker.handle_datagram(b"STATS victim")
+        attacker.handle_datagram(b"OFFER victim|x")
+        attacker.handle_datagram(b"JUNK victim")
+    # Registering the same id only spends the attacker's own tokens.
+    for _ in range(5):
+        attacker.handle_datagram(b"REGISTER victim")
+        attacker.handle_datagram(b"STATS victim")
+    assert attacker.connection.datagrams[-1] == "BUSY STATS victim"
+
+    victim.handle_datagram(b"REGISTER victim")
+    assert victim.connection.datagrams == ["REGISTERED victim"]
+
+
+def test_rate_limited_user_gets_busy_reply():
+    admission = AdmissionController(connection_rate=0, connection_burst=1000, user_rate=0, user_burst=2)
+    handler = WebTransportHandler(RecordingConnection(), 0, admission=admission)
+    handler.handle_datagram(b"REGISTER alice")
+    handler.handle_datagram(b"STATS alice")
+    handler.handle_datagram(b"STATS alice")
+    assert handler.connection.datagrams[-1] == "BUSY STATS alice"
@@ -0,0 +1,107 @@
+import asyncio
+
+import pytest
+from aioquic.quic.configuration import QuicConfiguration
+from aioquic.quic.connection import QuicConnection
+from quic_telephony.asgi import STREAM_HIGH_WATER, AsgiWebTransportSession
+from quic_telephony.protocol import WebTransportServerProtocol
+
+
+class FakeHttp:
+    def __init__(self):
+        self.sent = []
+
+    def send_headers(self, stream_id, headers, end_stream=False):
+        self.sent.append(("headers", stream_id, headers))
+
+    def send_data(self, stream_id, data, end_stream):
+        self.sent.append(("data", stream_id, data))
+
+    def send_datagram(self, stream_id, data):
+        self.sent.append(("datagram", stream_id, data))
+
+
+class FakeTransport:
+    def get_extra_info(self, name):
+        return None
+
+    def sendto(self, data, addr=None):
+        pass
+
+
+class FakeProtocol:
+    def __init__(self):
+        self._http = FakeHttp()
+        self.terminated = False
+        self.transmits = 0
+        self.finished = []
+
+    async def wait_stream_drained(self, stream_id, limit):
+        pass
+
+    def _transmit_soon(self):
+        self.transmits += 1
+
+    def session_finished(self, stream_id):
+        self.finished.append(stream_id)
+
+
+async def echo_once(scope, receive, send):
+    assert (await receive())["type"] == "webtransport.connect"
+    await send({"type": "webtransport.accept"})
+    message = await receive()
+    await send({"type": "webtransport.datagram.send", "data": message["data"]})
+
+
+@pytest.mark.asyncio
+async def test_session_runs_app_and_closes():
+    protocol = FakeProtocol()
+    session = AsgiWebTransportSession(protocol, 0, {"type": "webtransport", "path": "/wt"}, echo_once)
+    session.queue.put_nowait({"type": "webtransport.datagram.receive", "data": b"ping"})
+    await asyncio.wait_for(session.task, 1)
+
+    kinds = [entry[0] for entry in protocol._http.sent]
+    assert kinds == ["headers", "datagram", "data"]
+    assert protocol._http.sent[1][2] == b"ping"
+    assert protocol.finished == [0]
+
+
+async def ignore_close(scope, receive, send):
+    while True:
+        await receive()
+
+
+@pytest.mark.asyncio
+async def test_terminated_connection_cancels_stuck_sessions():
+    protocol = WebTransportServerProtocol(
+        QuicConnection(configuration=QuicConfiguration(is_client=True)),
+        app=ignore_close,
+        close_grace=0.01,
+    )
+    session = AsgiWebTransportSession(protocol, 0, {"type": "webtransport", "path": "/wt"}, ignore_close)
+    protocol._asgi_sessions[0] = session
+    protocol.connection_terminated()
+    await asyncio.wait_for(session.task, 1)
+    assert protocol._asgi_sessions == {}
+
+
+async def send_forever(scope, receive, send):
+    await receive()
+    while True:
+        await send({"type": "webtransport.stream.send", "stream": 4, "data": b"Z" * 65536})
+
+
+@pytest.mark.asyncio
+async def test_stream_sends_wait_for_the_buffer_to_drain():
+    protocol = WebTransportServerProtocol(QuicConnection(configuration=QuicConfiguration(is_client=True)))
+    protocol.connection_made(FakeTransport())
+    session = AsgiWebTransportSession(protocol, 0, {"type": "webtransport", "path": "/wt"}, send_forever)
+    await asyncio.sleep(0.05)
+    # Nothing is acknowledged before the handshake, so the app is held at the limit.
+    assert not session.task.done()
+    assert protocol.stream_buffered(4) <= STREAM_HIGH_WATER + 65536
+
+    # Once the connection is gone, the waiting send is released and the next one fails.
+    protocol.connection_terminated()
+    await asyncio.wait_for(session.task, 1)
+    assert protocol.stream_buffered(4) <= STREAM_HIGH_WATER + 65536
@@ -0,0 +1,118 @@
+import asyncio
+import json
+import os
+import sqlite3
+import time
+from types import SimpleNamespace
+
+import pytest
+import main
+from quic_telephony.cdr import CdrRecorder, JsonlCdrSink, SqliteCdrSink
+from quic_telephony.federation import FederationNode
+
+
+@pytest.mark.asyncio
+async def test_call_records_are_written_to_sqlite(tmp_path):
+    path = str(tmp_path / "cdr.db")
+    recorder = CdrRecorder(SqliteCdrSink(path))
+    recorder.start()
+    recorder.register("alice")
+    recorder.call_start("alice", "bob")
+    recorder.answer("bob", "alice")
+    recorder.bye("bob", "alice", stats={"samples": 3})
+    await recorder.stop()
+
+    db = sqlite3.connect(path)
+    assert db.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    rows = db.execute("SELECT event, user_id, peer_id, duration, extra FROM cdr ORDER BY rowid").fetchall()
+    assert [row[0] for row in rows] == ["register", "call_start", "answer", "bye"]
+    assert rows[2][3] is not None and rows[3][3] is not None
+    assert json.loads(rows[3][4]) == {"samples": 3}
+    assert recorder.written == 4
+
+
+@pytest.mark.asyncio
+async def test_records_beyond_buffer_are_dropped(tmp_path):
+    recorder = CdrRecorder(JsonlCdrSink(str(tmp_path)), max_buffer=2)
+    for user_id in ("a", "b", "c"):
+        recorder.register(user_id)
+    assert recorder.dropped == 1
+    await recorder.stop()
+
+    (name,) = os.listdir(tmp_path)
+    with open(tmp_path / name) as fp:
+        assert [json.loads(line)["user"] for line in fp] == ["a", "b"]
+
+
+class SlowSink:
+    def __init__(self):
+        self.records = []
+
+    def write(self, records):
+        time.sleep(0.1)
+        self.records += records
+
+    def close(self):
+        pass
+
+
+@pytest.mark.asyncio
+async def test_stop_waits_for_batch_being_written():
+    sink = SlowSink()
+    recorder = CdrRecorder(sink, batch_size=2)
+    recorder.start()
+    recorder.register("a")
+    recorder.register("b")
+    # Let the background task start writing the full batch.
+    await asyncio.sleep(0.01)
+    recorder.register("c")
+    await recorder.stop()
+    assert [record[2] for record in sink.records] == ["a", "b", "c"]
+    assert recorder.written == 3
+
+
+class ListSink:
+    def __init__(self):
+        self.records = []
+
+    def write(self, records):
+        self.records += records
+
+    def close(self):
+        pass
+
+
+def test_federated_calls_are_recorded_on_the_callers_node():
+    """
+    alice is on this node "a", bob on node "b", whose side of the link is
+    played by feeding its messages to handle_batch.
+    """
+    sent = []
+    node = FederationNode("a", {"b": ("127.0.0.1", 1)}, main.deliver)
+    node.peers["b"]._protocol = object()
+    node.peers["b"].send = sent.append
+    bob = next(f"bob{i}" for i in range(1000) if node.ring.node_for(f"bob{i}") == "b")
+    quic = SimpleNamespace(send_stream_data=lambda stream_id, data, end_stream: None)
+    handler = main.WebTransportHandler(SimpleNamespace(_quic=quic), 0)
+    main.federation, main.cdr = node, CdrRecorder(ListSink())
+    try:
+        handler.register("alice")
+        main.cdr._buffer.clear()
+        calls = []
+        for hang_up in ("alice", bob):
+            handler.handle_call(f"{bob}|sdp")
+            node.handle_batch([{"t": "ack", "id": sent[-1]["id"]}])
+            answer = {"t": "deliver", "user": "alice", "sender": bob, "origin": "b", "id": 0}
+            node.handle_batch([dict(answer, msg=f"ANSWER {bob}|sdp")])
+            if hang_up == "alice":
+                handler.handle_bye(bob)
+                node.handle_batch([{"t": "ack", "id": sent[-1]["id"]}])
+            else:
+                node.handle_batch([dict(answer, msg=f"BYE {bob}")])
+            calls.append([(record[1], record[4] is not None) for record in main.cdr._buffer])
+            main.cdr._buffer.clear()
+        events = [("call_start", False), ("answer", True), ("bye", True)]
+        assert calls == [events, events]
+    finally:
+        main.federation, main.cdr = None, None
+        main.clients.pop("alice", None)
@@ -0,0 +1,83 @@
+import asyncio
+import json
+
+import pytest
+from demo import CHUNK_SIZE, BenchCounter, generate_payload, wt_bench
+from quic_telephony.bench import MAX_DATAGRAM_SIZE, bench_datagram
+
+
+async def run_bench(mode, messages):
+    """
+    Run wt_bench over the given received messages and return what it sent.
+    """
+    queue = asyncio.Queue()
+    queue.put_nowait({"type": "webtransport.connect"})
+    for message in messages:
+        queue.put_nowait(message)
+    queue.put_nowait({"type": "webtransport.close"})
+    sent = []
+
+    async def send(message):
+        sent.append(message)
+
+    await asyncio.wait_for(wt_bench({"type": "webtransport"}, queue.get, send, mode), 1)
+    assert sent[0] == {"type": "webtransport.accept"}
+    return sent[1:]
+
+
+def stream(data, end_stream=False, stream_id=4):
+    return {"type": "webtransport.stream.receive", "data": data, "stream": stream_id, "end_stream": end_stream}
+
+
+@pytest.mark.asyncio
+async def test_generate_payload_chunks():
+    chunks = [chunk async for chunk in generate_payload(CHUNK_SIZE * 2 + 10)]
+    assert [len(chunk) for chunk in chunks] == [CHUNK_SIZE, CHUNK_SIZE, 10]
+    assert [chunk async for chunk in generate_payload(0)] == []
+
+
+def test_bench_counter_report():
+    counter = BenchCounter()
+    assert counter.report()["bytes_per_sec"] == 0.0
+    counter.add(10)
+    counter.add(5)
+    report = counter.report()
+    assert (report["bytes"], report["messages"]) == (15, 2)
+
+
+@pytest.mark.asyncio
+async def test_source_waits_for_the_whole_count():
+    sent = await run_bench("source", [stream(b"1"), stream(b"00", end_stream=True)])
+    assert sum(len(message["data"]) for message in sent) == 100
+    assert sent[-1]["end_stream"]
+
+
+@pytest.mark.asyncio
+async def test_source_rejects_a_bad_count():
+    sent = await run_bench("source", [stream(b"lots", end_stream=True)])
+    assert [(message["data"], message.get("end_stream")) for message in sent] == [(b"", True)]
+
+
+@pytest.mark.asyncio
+async def test_echo_and_report():
+    sent = await run_bench(
+        "echo",
+        [stream(b"ping"), {"type": "webtransport.datagram.receive", "data": b"REPORT"}],
+    )
+    assert sent[0]["data"] == b"ping"
+    assert json.loads(sent[1]["data"])["bytes"] == 4
+
+
+@pytest.mark.asyncio
+async def test_source_reports_bytes_sent():
+    sent = await run_bench(
+        "source",
+        [stream(b"1000", end_stream=True), {"type": "webtransport.datagram.receive", "data": b"REPORT"}],
+    )
+    assert json.loads(sent[-1]["data"])["bytes"] == 1000
+
+
+@pytest.mark.asyncio
+async def test_bench_rejects_oversized_datagrams():
+    with pytest.raises(ValueError):
+        await bench_datagram(None, "localhost:4433", MAX_DATAGRAM_SIZE + 1, 1)
@@ -0,0 +1,162 @@
+import asyncio
+import os
+
+import pytest
+from aioquic.quic.configuration import QuicConfiguration
+from aioquic.quic.connection import QuicConnection
+from aioquic.quic.events import StreamDataReceived
+from quic_telephony.federation import FRAME_HEADER, FederationNode, FederationProtocol, HashRing
+
+ROOT = os.path.dirname(os.path.dirname(__file__))
+CERTIFICATE = os.path.join(ROOT, "cert.pem")
+PRIVATE_KEY = os.path.join(ROOT, "key.pem")
+
+
+def test_hash_ring_is_stable():
+    ring = HashRing(["a", "b", "c"])
+    owners = {ring.node_for(f"user{i}") for i in range(100)}
+    assert owners == {"a", "b", "c"}
+    assert ring.node_for("user1") == HashRing(["c", "b", "a"]).node_for("user1")
+
+
+@pytest.mark.asyncio
+async def test_route_between_nodes_on_localhost():
+    ports = {"a": 14541, "b": 14542, "c": 14543}
+    inboxes = {name: [] for name in ports}
+    nodes = {}
+
+    def make_deliver(name):
+        def deliver(user_id, message):
+            if user_id not in nodes[name].local_users:
+                return False
+            inboxes[name].append((user_id, message))
+            return True
+        return deliver
+
+    for name, port in ports.items():
+        peers = {peer: ("127.0.0.1", peer_port) for peer, peer_port in ports.items() if peer != name}
+        nodes[name] = FederationNode(name, peers, make_deliver(name), keepalive=1.0)
+    for name, node in nodes.items():
+        await node.start("127.0.0.1", ports[name], CERTIFICATE, PRIVATE_KEY)
+
+    try:
+        for _ in range(100):
+            if all(peer.connected for node in nodes.values() for peer in node.peers.values()):
+                break
+            await asyncio.sleep(0.05)
+
+        # Pick users so that neither is homed on the node it connects to.
+        ring = nodes["a"].ring
+        alice = next(f"alice{i}" for i in range(1000) if ring.node_for(f"alice{i}") != "a")
+        bob = next(f"bob{i}" for i in range(1000) if ring.node_for(f"bob{i}") != "b")
+        nodes["a"].register(alice)
+        nodes["b"].register(bob)
+        await asyncio.sleep(0.2)
+
+        acked = []
+        nodes["a"].route(alice, bob, f"CALL {alice}|sdp", lambda: acked.append(bob))
+        nodes["b"].route(bob, "nobody", "CALL nobody|sdp", lambda: acked.append("nobody"))
+        expected = sorted([(bob, f"CALL {alice}|sdp"), (bob, "ERROR User nobody not found")])
+        for _ in range(100):
+            if sorted(inboxes["b"]) == expected and acked:
+                break
+            await asyncio.sleep(0.05)
+        assert sorted(inboxes["b"]) == expected
+        assert inboxes["a"] == []
+        assert acked == [bob]
+        assert nodes["a"]._callbacks == {} and nodes["b"]._callbacks == {}
+    finally:
+        for node in nodes.values():
+            await node.stop()
+
+
+def test_messages_naming_unknown_nodes_are_ignored():
+    node = FederationNode("a", {"b": ("127.0.0.1", 1)}, lambda user_id, message: True)
+    node.handle_batch(
+        [
+            {"t": "loc", "user": "alice", "node": "mallory"},
+            {"t": "loc", "user": "bob", "node": "b"},
+            {"t": "deliver", "user": "bob", "msg": "BYE x", "sender": "x", "origin": "mallory"},
+        ]
+    )
+    assert node.locations == {"bob": "b"}
+
+
+class FakeTransport:
+    def sendto(self, data, addr=None):
+        pass
+
+
+@pytest.mark.asyncio
+async def test_oversized_frame_closes_the_link():
+    batches = []
+    node = FederationNode("a", {}, lambda user_id, message: True, max_frame_size=100)
+    node.handle_batch = batches.append
+    connection = QuicConnection(configuration=QuicConfiguration(is_client=True))
+    connection.connect(("127.0.0.1", 1), now=asyncio.get_event_loop().time())
+    protocol = FederationProtocol(connection, node=node)
+    protocol.connection_made(FakeTransport())
+    protocol.quic_event_received(
+        StreamDataReceived(data=FRAME_HEADER.pack(2**31) + b"[", end_stream=False, stream_id=0)
+    )
+    assert protocol.rejected
+    assert batches == []
+
+
+@pytest.mark.asyncio
+async def test_inbound_links_need_the_secret():
+    ports = {"a": 14544, "b": 14545, "intruder": 14546}
+    inbox = []
+
+    def deliver(user_id, message):
+        inbox.append(message)
+        return True
+
+    b = FederationNode("b", {"a": ("127.0.0.1", ports["a"])}, deliver, keepalive=1.0, secret="s")
+    a = FederationNode("a", {"b": ("127.0.0.1", ports["b"])}, deliver, keepalive=1.0, secret="s")
+    # Claims to be node a, but does not know the secret.
+    intruder = FederationNode("a", {"b": ("127.0.0.1", ports["b"])}, deliver, keepalive=1.0, secret="guess")
+    nodes = {"a": a, "b": b, "intruder": intruder}
+    for name, node in nodes.items():
+        await node.start("127.0.0.1", ports[name], CERTIFICATE, PRIVATE_KEY)
+
+    try:
+        for _ in range(100):
+            if a.peers["b"].connected and intruder.peers["b"].connected:
+                break
+            await asyncio.sleep(0.05)
+        for node, text in ((intruder, "CALL mallory|sdp"), (a, "CALL alice|sdp")):
+            node.send("b", {"t": "deliver", "user": "bob", "msg": text, "sender": "x", "origin": "a"})
+        for _ in range(100):
+            if inbox:
+                break
+            await asyncio.sleep(0.05)
+        await asyncio.sleep(0.2)
+        assert inbox == ["CALL alice|sdp"]
+    finally:
+        for node in nodes.values():
+            await node.stop()
+
+
+def test_messages_for_a_peer_that_is_down_fail_back():
+    inbox = []
+
+    def deliver(user_id, message):
+        inbox.append((user_id, message))
+        return True
+
+    node = FederationNode("a", {"b": ("127.0.0.1", 1)}, deliver)
+    bob = next(f"bob{i}" for i in range(1000) if node.ring.node_for(f"bob{i}") == "a")
+    node.handle_batch([{"t": "loc", "user": bob, "node": "b"}])
+    acked = []
+    node.route("alice", bob, "CALL alice|sdp", lambda: acked.append(bob))
+    assert inbox == [("alice", f"ERROR User {bob} not found")]
+    assert acked == [] and node._callbacks == {}
+
+    node.peers["b"].pending.append(
+        {"t": "deliver", "user": bob, "msg": "BYE alice", "sender": "alice", "origin": "a"}
+    )
+    node.link_lost("b")
+    assert node.locations == {}
+    assert node.peers["b"].pending == []
+    assert inbox[-1] == ("alice", f"ERROR User {bob} not found")
@@ -0,0 +1,47 @@
+import pytest
+from aiortc import RTCConfiguration, RTCPeerConnection
+from quic_telephony.ice import IceLiteConfig, create_answer, create_peer_connection
+
+
+def test_ice_lite_is_session_level():
+    config = IceLiteConfig(["127.0.0.1"])
+    sdp = "v=0\r\ns=-\r\nt=0 0\r\nm=audio 9 UDP/TLS/RTP/SAVPF 0\r\na=mid:0\r\n"
+    lines = config.apply_to_answer(sdp).split("\r\n")
+    assert lines.index("a=ice-lite") < lines.index("m=audio 9 UDP/TLS/RTP/SAVPF 0")
+
+
+@pytest.mark.asyncio
+async def test_answer_only_advertises_configured_host():
+    client = RTCPeerConnection(RTCConfiguration(iceServers=[]))
+    client.addTransceiver("audio")
+    await client.setLocalDescription(await client.createOffer())
+
+    config = IceLiteConfig(["127.0.0.1"], advertised_address="203.0.113.7")
+    server = create_peer_connection(config)
+    answer = await create_answer(server, client.localDescription.sdp, config)
+
+    candidates = [line for line in answer.split("\r\n") if line.startswith("a=candidate:")]
+    assert len(candidates) == 1
+    assert " 203.0.113.7 " in candidates[0]
+    assert "a=ice-lite" in answer
+
+    await client.close()
+    await server.close()
+
+
+@pytest.mark.asyncio
+async def test_gathering_falls_back_without_aioice_internals(monkeypatch):
+    monkeypatch.setattr("quic_telephony.ice._CONNECTION_ATTRIBUTES", ("_not_in_aioice",))
+    client = RTCPeerConnection(RTCConfiguration(iceServers=[]))
+    client.addTransceiver("audio")
+    await client.setLocalDescription(await client.createOffer())
+
+    config = IceLiteConfig(["127.0.0.1"])
+    server = create_peer_connection(config)
+    answer = await create_answer(server, client.localDescription.sdp, config)
+
+    assert any(line.startswith("a=candidate:") for line in answer.split("\r\n"))
+    assert "a=ice-lite" in answer
+
+    await client.close()
+    await server.close()
@@ -0,0 +1,70 @@
+import os
+
+import pytest
+import main
+from quic_telephony.federation import FederationNode
+from quic_telephony.loopback import DEFAULT_SERVERS, LoopbackHarness, load_protocol, relay_calls
+from quic_telephony.protocol import WebTransportServerProtocol
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CERTIFICATE = os.path.join(ROOT, "cert.pem")
+PRIVATE_KEY = os.path.join(ROOT, "key.pem")
+
+
+async def run_relay(**network):
+    harness = LoopbackHarness(
+        main.WebTransportServerProtocol, certificate=CERTIFICATE, private_key=PRIVATE_KEY, **network
+    )
+    setups = await relay_calls(harness, calls=5, via="stream")
+    await harness.close()
+    return harness.report(setups)
+
+
+@pytest.mark.asyncio
+async def test_relay_calls_are_reproducible_under_loss():
+    first = await run_relay(loss=0.05, reorder=0.1, jitter=0.005, seed=3)
+    second = await run_relay(loss=0.05, reorder=0.1, jitter=0.005, seed=3)
+    assert first["calls"] == 5
+    assert first["messages"] == 17
+    assert first["lost"] > 0
+    for key in ("packets", "lost", "simulated_seconds"):
+        assert first[key] == second[key]
+
+
+@pytest.mark.asyncio
+async def test_media_server_session():
+    harness = LoopbackHarness(WebTransportServerProtocol, certificate=CERTIFICATE, private_key=PRIVATE_KEY)
+    client = await harness.connect()
+    await harness.exchange(client, "REGISTER alice", expected="REGISTERED alice")
+    # BYE is handled in a task, which the harness waits for.
+    await harness.exchange(client, "BYE alice", expected="CALL_ENDED alice")
+    await harness.close()
+    assert harness.report([])["server_cpu_per_message_us"] > 0
+
+
+@pytest.mark.asyncio
+async def test_relay_confirms_only_delivered_messages():
+    main.federation = FederationNode("a", {}, main.deliver)
+    try:
+        harness = LoopbackHarness(main.WebTransportServerProtocol, certificate=CERTIFICATE, private_key=PRIVATE_KEY)
+        alice = await harness.connect()
+        bob = await harness.connect()
+        await harness.exchange(alice, "REGISTER alice", expected="REGISTERED alice")
+        await harness.exchange(bob, "REGISTER bob", expected="REGISTERED bob")
+        await harness.exchange(bob, "ANSWER alice|sdp", expected="ANSWER_SENT alice")
+        # carol is not local, so the BYE goes through the federation, which
+        # answers with an error instead of a confirmation.
+        await harness.exchange(alice, "BYE carol", expected="ERROR User carol not found")
+        assert "BYE_SENT" not in alice.received
+        assert main.federation.locations == {"alice": "a", "bob": "a"}
+
+        await harness.close()
+        await harness.run_until(lambda: not main.federation.locations)
+        assert "alice" not in main.clients and "bob" not in main.clients
+    finally:
+        main.federation = None
+
+
+def test_default_servers_match_flows():
+    assert load_protocol(DEFAULT_SERVERS["relay"]) is main.WebTransportServerProtocol
+    assert load_protocol(DEFAULT_SERVERS["media"]) is WebTransportServerProtocol
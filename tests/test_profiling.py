@@ -0,0 +1,35 @@
+import asyncio
+import json
+import os
+import time
+
+import pytest
+from quic_telephony.profiling import Profiler, label_task, note_command
+
+
+async def slow_offer():
+    await asyncio.sleep(0)
+    time.sleep(0.05)
+
+
+@pytest.mark.asyncio
+async def test_slow_callback_is_attributed_to_command(tmp_path):
+    profiler = Profiler(output_dir=str(tmp_path), interval=0.001, slow_callback_ms=20)
+    prefix = profiler.start(duration=5)
+
+    note_command("OFFER", "user123|v=0")
+    task = asyncio.ensure_future(slow_offer())
+    label_task(task)
+    await task
+
+    assert profiler.stop() == prefix
+    assert not profiler.active
+    assert [record["command"] for record in profiler.slow_callbacks] == ["OFFER user123"]
+
+    for _ in range(100):
+        if os.path.exists(f"{prefix}.slow.jsonl"):
+            break
+        await asyncio.sleep(0.01)
+    folded = open(f"{prefix}.folded").read()
+    assert "slow_offer" in folded
+    assert json.loads(open(f"{prefix}.slow.jsonl").readline())["duration_ms"] >= 20
@@ -0,0 +1,90 @@
+from types import SimpleNamespace
+
+import pytest
+
+from quic_telephony.sessions import WebTransportHandler
+from quic_telephony.stats import CallQualityWindow, StatsCollector, stats_reply
+
+
+def make_report(lost, received, sent, rtt=0.05):
+    return {
+        "inbound": SimpleNamespace(
+            type="inbound-rtp", kind="audio", packetsLost=lost, packetsReceived=received, jitter=48
+        ),
+        "remote": SimpleNamespace(type="remote-inbound-rtp", roundTripTime=rtt),
+        "transport": SimpleNamespace(type="transport", bytesSent=sent, bytesReceived=0),
+    }
+
+
+def test_window_uses_deltas():
+    window = CallQualityWindow(size=2)
+    window.add_report(make_report(0, 100, 0), now=0.0)
+    window.add_report(make_report(10, 190, 1000), now=1.0)
+    summary = window.summary()
+    assert summary["samples"] == 1
+    assert summary["packet_loss"]["last"] == 0.1
+    assert summary["rtt_ms"]["last"] == 50.0
+    assert summary["jitter_ms"]["last"] == 1.0
+    assert summary["bitrate_kbps"]["last"] == 8.0
+
+
+def test_window_converts_jitter_with_codec_clock_rate():
+    window = CallQualityWindow()
+    window.add_report(make_report(0, 100, 0), now=0.0, rates={"audio": 8000})
+    window.add_report(make_report(0, 200, 0), now=1.0, rates={"audio": 8000})
+    assert window.summary()["jitter_ms"]["last"] == 6.0
+
+
+def test_window_skips_missing_round_trip_time():
+    window = CallQualityWindow()
+    window.add_report(make_report(0, 100, 0, rtt=None), now=0.0)
+    window.add_report(make_report(0, 200, 1000, rtt=None), now=1.0)
+    summary = window.summary()
+    assert summary["samples"] == 1
+    assert summary["rtt_ms"]["last"] == 0.0
+
+
+class StatsConnection:
+    connectionState = "connected"
+    localDescription = None
+
+    def __init__(self, report):
+        self.report = report
+
+    async def getStats(self):
+        return self.report
+
+
+@pytest.mark.asyncio
+async def test_bad_report_does_not_stop_other_calls():
+    collector = StatsCollector()
+    collector.track("broken", StatsConnection({"bad": SimpleNamespace(type="inbound-rtp")}))
+    collector.track("good", StatsConnection(make_report(0, 100, 0)))
+    await collector.poll(["broken", "good"])
+    await collector.poll(["broken", "good"])
+    assert collector.summary("broken")["samples"] == 0
+    assert collector.summary("good")["samples"] == 1
+
+
+def test_stats_reply():
+    collector = StatsCollector()
+    assert stats_reply(None, "user123") == "ERROR Stats collection disabled"
+    assert stats_reply(collector, "user123") == "ERROR User user123 not found"
+    assert stats_reply(collector, "").startswith('STATS |{"calls":0')
+
+
+class RecordingConnection:
+    def __init__(self):
+        self.datagrams = []
+
+    def send_datagram(self, stream_id, data):
+        self.datagrams.append((stream_id, data.decode()))
+
+
+def test_stats_command_is_answered_on_the_session():
+    connection = RecordingConnection()
+    handler = WebTransportHandler(connection, stream_id=0, stats_collector=StatsCollector())
+    handler.handle_datagram(b"STATS user123")
+    handler.handle_datagram(b"STATS ")
+    assert connection.datagrams[0] == (0, "ERROR User user123 not found")
+    assert connection.datagrams[1][1].startswith('STATS |{"calls":0')